@@ -4,5 +4,10 @@ setup(
     name="dps-converter",
     version="0.1.0",
     packages=find_packages(),
-    entry_points={"console_scripts": ["dps-converter = src.main:main"]},
+    entry_points={
+        "console_scripts": [
+            "dps-converter = src.main:main",
+            "dps-merge = src.merge:main",
+        ]
+    },
 )
@@ -0,0 +1,103 @@
+# times each stage of a conversion over generated maps
+#
+# For every size and density a map is generated and written to a temporary
+# file, then converted repeat times. Each stage is timed on its own: loading
+# the TSV file, looking up the wall rules of every empty cell in the compiled
+# rule table as the converter does, emitting the map objects (which includes
+# those lookups again), and saving the map as a JSON .dps file.
+
+import os
+import platform
+import tempfile
+import time
+
+from src.bench.generate import write
+from src.converter import Converter
+from src.dungeon import Dungeon, parse_donjon_tsv
+
+STAGES = ("load", "rules", "emit", "serialize")
+
+
+# the neighbourhood of every empty cell looked up in the rule table, the
+# pass Converter.draw_cell makes for obstacle walls, without drawing anything
+def match_rules(converter: Converter, dungeon: Dungeon) -> int:
+    table = converter.rules.compile()
+    matched = 0
+    for y in range(dungeon.height):
+        for x in range(dungeon.width):
+            if dungeon.tile_empty(x, y):
+                matched += len(table[dungeon.neighbourhood(x, y)])
+    return matched
+
+
+# time one conversion of filename, saved to output_filename, returning seconds
+# per stage and the size of the saved file
+def run_once(converter: Converter, filename: str, output_filename: str, indent=2):
+    times = {}
+
+    started = time.perf_counter()
+    with open(filename, "rb") as f:
+        dungeon = parse_donjon_tsv(f.read(), filename, verbose=False)
+    times["load"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    match_rules(converter, dungeon)
+    times["rules"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    map = converter.convert(dungeon)
+    times["emit"] = time.perf_counter() - started
+
+    encoded = map.save(output_filename, "json", indent)
+    times["serialize"] = encoded.seconds
+
+    return times, encoded.bytes
+
+
+# Benchmark every (size, density) pair, sizes being (width, height) tuples.
+# settings are Converter keyword arguments. Returns a dict that can be dumped
+# as JSON, with the best and mean time of each stage per map.
+def run(sizes, densities, seed=0, repeat=3, settings=None, indent=2):
+    settings = settings or {}
+    converter = Converter(seed=seed, **settings)
+    results = []
+    for width, height in sizes:
+        for density in densities:
+            with tempfile.TemporaryDirectory() as directory:
+                filename = os.path.join(directory, "map.tsv")
+                output_filename = os.path.join(directory, "map.dps")
+                write(filename, width, height, density, seed)
+                runs = []
+                for _ in range(repeat):
+                    times, output_bytes = run_once(
+                        converter, filename, output_filename, indent
+                    )
+                    runs.append(times)
+                input_bytes = os.path.getsize(filename)
+
+            results.append(
+                {
+                    "width": width,
+                    "height": height,
+                    "density": density,
+                    "input_bytes": input_bytes,
+                    "output_bytes": output_bytes,
+                    "stages": {
+                        stage: {
+                            "min": min(times[stage] for times in runs),
+                            "mean": sum(times[stage] for times in runs) / len(runs),
+                        }
+                        for stage in STAGES
+                    },
+                }
+            )
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeat": repeat,
+        "indent": indent,
+        "settings": settings,
+        "results": results,
+    }
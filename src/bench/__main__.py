@@ -0,0 +1,92 @@
+import json
+
+import click
+
+from src.bench import STAGES, run, startup
+
+
+def _numbers(kind):
+    def parse(ctx, param, value):
+        try:
+            return [kind(item) for item in value.split(",")]
+        except ValueError:
+            raise click.BadParameter(f"expected comma separated numbers: {value}")
+
+    return parse
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default="50,100,200,400",
+    show_default=True,
+    callback=_numbers(int),
+    help="Comma separated side lengths of the square maps to generate.",
+)
+@click.option(
+    "--densities",
+    default="0.2,0.5",
+    show_default=True,
+    callback=_numbers(float),
+    help="Comma separated fractions of each map to cover with rooms.",
+)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--repeat", type=int, default=3, show_default=True)
+@click.option("--compact", is_flag=True, help="Serialize without indentation.")
+@click.option("--merge-floors", is_flag=True)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the results as JSON to this file.",
+)
+@click.option(
+    "--startup",
+    is_flag=True,
+    help="Instead, time the command line tool on a 20x20 map against the "
+    "startup budget, failing if it is over.",
+)
+def main(sizes, densities, seed, repeat, compact, merge_floors, output, startup):
+    if startup:
+        check_startup(seed, repeat, output)
+        return
+
+    settings = dict(merge_floors=merge_floors)
+    report = run(
+        [(size, size) for size in sizes],
+        densities,
+        seed,
+        repeat,
+        settings,
+        None if compact else 2,
+    )
+
+    click.echo(f"{'map':>14} " + " ".join(f"{stage:>10}" for stage in STAGES))
+    for result in report["results"]:
+        name = f"{result['width']}x{result['height']}@{result['density']}"
+        times = [result["stages"][stage]["min"] for stage in STAGES]
+        click.echo(f"{name:>14} " + " ".join(f"{t:>9.4f}s" for t in times))
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def check_startup(seed, repeat, output):
+    report = startup.measure(repeat=repeat, seed=seed)
+    click.echo(
+        f"{report['size']}x{report['size']} map converted in "
+        f"{report['seconds'] * 1000:.1f}ms "
+        f"(bare interpreter {report['interpreter_seconds'] * 1000:.1f}ms, "
+        f"budget {report['budget'] * 1000:.0f}ms)"
+    )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    if not report["within_budget"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# generates donjon style TSV maps for benchmarking
+#
+# Rooms are scattered over the map until they cover about density of it, then
+# each room is joined to the next by an L shaped corridor with a door where the
+# corridor leaves the room. A few rooms get a staircase. The same seed always
+# gives the same map.
+
+import random
+
+DOORS = ("DT", "DB", "DL", "DR", "DST", "DSB", "DSL", "DSR", "DPT", "DPL")
+STAIRS = (("SU", "SUU"), ("SD", "SDD"))
+
+
+def generate(width: int, height: int, density: float = 0.3, seed: int = 0):
+    r = random.Random(seed)
+    grid = [[""] * width for _ in range(height)]
+
+    rooms = []
+    covered = 0
+    attempts = 0
+    while covered < density * width * height and attempts < width * height:
+        attempts += 1
+        w, h = r.randint(3, 11), r.randint(3, 11)
+        if w + 2 > width or h + 2 > height:
+            continue
+        x, y = r.randint(1, width - w - 1), r.randint(1, height - h - 1)
+        for row in grid[y : y + h]:
+            row[x : x + w] = ["F"] * w
+        rooms.append((x, y, w, h))
+        covered += w * h
+
+    for a, b in zip(rooms, rooms[1:]):
+        _corridor(grid, r, a, b)
+
+    for x, y, w, h in rooms:
+        if h >= 2 and r.random() < 0.1:
+            top, bottom = r.choice(STAIRS)
+            grid[y][x] = top
+            grid[y + 1][x] = bottom
+
+    return "".join("\t".join(row) + "\n" for row in grid)
+
+
+def write(filename: str, width: int, height: int, density: float = 0.3, seed=0):
+    with open(filename, "w") as f:
+        f.write(generate(width, height, density, seed))
+
+
+# join the centres of rooms a and b, across then down
+def _corridor(grid, r, a, b):
+    ax, ay = a[0] + a[2] // 2, a[1] + a[3] // 2
+    bx, by = b[0] + b[2] // 2, b[1] + b[3] // 2
+    door = r.random() < 0.5
+    cells = [(x, ay) for x in _span(ax, bx)] + [(bx, y) for y in _span(ay, by)]
+    for x, y in cells:
+        if grid[y][x] == "":
+            if door and _next_to(a, x, y):
+                grid[y][x] = r.choice(DOORS)
+                door = False
+            else:
+                grid[y][x] = "F"
+
+
+def _span(start: int, end: int):
+    step = 1 if end >= start else -1
+    return range(start, end + step, step)
+
+
+# whether x, y is just outside the room on one of its sides
+def _next_to(room, x: int, y: int) -> bool:
+    rx, ry, w, h = room
+    across = rx <= x < rx + w and y in (ry - 1, ry + h)
+    down = ry <= y < ry + h and x in (rx - 1, rx + w)
+    return across or down
@@ -0,0 +1,50 @@
+# times the whole command line tool on a small map
+#
+# For small maps the time goes on starting Python, importing modules and
+# setting up the converter rather than on converting, so this runs
+# dps-converter in a fresh interpreter each time and compares the best run
+# against a budget.
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.bench.generate import write
+
+# the most a 20x20 map may take from starting the interpreter to exiting
+STARTUP_BUDGET = 0.08
+
+
+def _best(args, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Returns the best time of converting a size x size map with the command line
+# tool, the best time of starting and stopping a bare interpreter for
+# comparison, and the budget.
+def measure(size: int = 20, repeat: int = 5, seed: int = 0):
+    with tempfile.TemporaryDirectory() as directory:
+        input_filename = os.path.join(directory, "map.tsv")
+        output_filename = os.path.join(directory, "map.dps")
+        write(input_filename, size, size, 0.3, seed)
+
+        interpreter = _best([sys.executable, "-c", "pass"], repeat)
+        # the plain invocation, with every option at its default
+        command = [sys.executable, "-m", "src.main", input_filename, output_filename]
+        seconds = _best(command, repeat)
+
+    return {
+        "size": size,
+        "seconds": seconds,
+        "interpreter_seconds": interpreter,
+        "budget": STARTUP_BUDGET,
+        "within_budget": seconds <= STARTUP_BUDGET,
+    }
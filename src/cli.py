@@ -0,0 +1,274 @@
+# the full command line of dps-converter; src.main handles the plain
+# INPUT OUTPUT conversion without it, as importing click takes longer than
+# converting a small map
+
+import click
+from src.converter import Converter
+from src.converter.cache import DEFAULT_MAX_BYTES, OutputCache
+from src.converter.profile import Profile
+from src.dps.encoders import ENCODERS, suffix
+from src.dungeon import DonjonParseError
+from src.main import DEFAULTS, convert, converter_settings
+import os
+import time
+
+
+@click.command()
+@click.argument("input_filename")
+@click.argument("output_filename")
+@click.option(
+    "--compact",
+    is_flag=True,
+    default=DEFAULTS["compact"],
+    help="Write JSON without indentation.",
+)
+@click.option(
+    "--encoder",
+    type=click.Choice(ENCODERS),
+    default=DEFAULTS["encoder"],
+    show_default=True,
+    help="Write plain JSON, gzip compressed JSON for archiving, or JSON encoded "
+    "with orjson when it is installed, which is faster but holds the whole "
+    "document in memory.",
+)
+@click.option(
+    "--merge-floors",
+    is_flag=True,
+    default=DEFAULTS["merge_floors"],
+    help="Merge floor cells into as few rectangular plots as possible.",
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=DEFAULTS["seed"],
+    help="Seed for the texture variants and decorations, so that converting "
+    "the same map again gives the same output. Random by default. Only seeded "
+    "conversions are cached.",
+)
+@click.option(
+    "--decorations",
+    default=DEFAULTS["decorations"],
+    help="Decorations scattered over room interiors, as texture=density pairs "
+    "separated by commas, where density is the chance of the decoration on "
+    'any one cell, or "none". Defaults to blood=0.03,skeleton=0.02,'
+    "broken_weapon=0.05.",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    default=DEFAULTS["stream"],
+    help="Convert a few rows at a time to keep memory flat on huge maps.",
+)
+@click.option(
+    "--batch",
+    is_flag=True,
+    help="Convert many maps: INPUT is a directory, a glob pattern or a manifest "
+    "file listing one map per line, and OUTPUT is a directory.",
+)
+@click.option(
+    "--parallel",
+    is_flag=True,
+    default=DEFAULTS["parallel"],
+    help="Convert one big map in bands of rows across worker processes.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=DEFAULTS["workers"],
+    help="Number of worker processes for --batch and --parallel. Defaults to "
+    "the CPU count.",
+)
+@click.option(
+    "--cell-index",
+    is_flag=True,
+    help="Also write OUTPUT.cells, recording which cells each object was drawn "
+    "for, so that edits to the map can later be converted with --previous.",
+)
+@click.option(
+    "--previous",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Only redraw the cells that changed since this earlier version of "
+    "INPUT, updating the .dps file converted from it with --cell-index.",
+)
+@click.option(
+    "--previous-output",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="The .dps file converted from --previous. Defaults to OUTPUT.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always convert, without looking in or adding to the output cache.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Where converted maps are cached. Defaults to ~/.cache/dps-converter.",
+)
+@click.option(
+    "--cache-size",
+    type=int,
+    default=DEFAULT_MAX_BYTES // 1024 // 1024,
+    show_default=True,
+    help="Most megabytes the cache may hold before old maps are deleted.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print how long each stage took, how often the map, dungeon, ID and "
+    "texture methods were called, how many objects were emitted and the peak "
+    "memory use.",
+)
+@click.option(
+    "--profile-json",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the --profile report to this file as JSON.",
+)
+@click.option(
+    "--cprofile",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Also run the conversion under cProfile and dump the stats here.",
+)
+def main(
+    input_filename: str,
+    output_filename: str,
+    compact: bool,
+    encoder: str,
+    merge_floors: bool,
+    seed: int,
+    decorations: str,
+    stream: bool,
+    batch: bool,
+    parallel: bool,
+    workers: int,
+    cell_index: bool,
+    previous: str,
+    previous_output: str,
+    no_cache: bool,
+    cache_dir: str,
+    cache_size: int,
+    profile: bool,
+    profile_json: str,
+    cprofile: str,
+):
+    try:
+        settings = converter_settings(merge_floors, seed, decorations)
+        # checks the decorations against the texture catalog
+        converter = Converter(**settings)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--decorations")
+    indent = None if compact else 2
+    cache = None
+    # unseeded conversions are meant to differ from run to run
+    if not (no_cache or cell_index or previous or seed is None):
+        cache = dict(directory=cache_dir, max_bytes=cache_size * 1024 * 1024)
+
+    if (cell_index or previous) and (batch or stream or parallel):
+        raise click.UsageError(
+            "--cell-index and --previous cannot be used with --batch, --stream "
+            "or --parallel"
+        )
+
+    if parallel and (batch or stream):
+        raise click.UsageError("--parallel cannot be used with --batch or --stream")
+
+    if batch:
+        if profile or profile_json or cprofile:
+            raise click.UsageError("--profile cannot be used with --batch")
+        options = dict(indent=indent, stream=stream, encoder=encoder)
+        run_batch(input_filename, output_filename, settings, options, workers, cache)
+        return
+
+    # checked here rather than with click.Path, as with --batch INPUT can be a
+    # directory or a glob pattern
+    if not os.path.isfile(input_filename):
+        raise click.BadParameter(
+            f"{input_filename!r} does not exist or is not a file.",
+            param_hint="'INPUT_FILENAME'",
+        )
+
+    options = dict(
+        indent=indent,
+        encoder=encoder,
+        stream=stream,
+        parallel=parallel,
+        workers=workers,
+    )
+    if cache is not None:
+        options.update(cache=OutputCache(**cache))
+
+    if cell_index or previous:
+        options.update(
+            cell_index=True,
+            previous=previous,
+            previous_output=previous_output or output_filename,
+        )
+
+    report = Profile()
+    try:
+        if not (profile or profile_json or cprofile):
+            convert(converter, input_filename, output_filename, report, **options)
+            return
+
+        with report.watching(cprofile):
+            convert(converter, input_filename, output_filename, report, **options)
+    except DonjonParseError as e:
+        raise click.ClickException(str(e))
+
+    if profile:
+        click.echo(report.summary(), err=True)
+    if profile_json:
+        import json
+
+        with open(profile_json, "w") as f:
+            json.dump(report.report(), f, indent=2)
+
+
+def run_batch(inputs, output_dir, settings, options, workers, cache):
+    # the process pool is slow to import and only needed here
+    from src.converter.batch import convert_batch, find_jobs
+
+    try:
+        jobs = find_jobs(inputs, output_dir, suffix(options["encoder"]))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if not jobs:
+        raise click.ClickException(f"no donjon files found in {inputs}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    click.echo(f"converting {len(jobs)} maps into {output_dir}")
+
+    started = time.perf_counter()
+    failed = []
+    input_bytes = 0
+    output_bytes = 0
+    for result in convert_batch(jobs, settings, options, workers, cache):
+        job = result.job
+        input_bytes += result.input_bytes
+        if result.error is None:
+            output_bytes += result.output_bytes
+            status = "cached" if result.cached else "ok"
+            click.echo(
+                f"{status:<6} {job.input_filename} -> {job.output_filename} "
+                f"({result.seconds:.2f}s, {result.output_bytes} bytes)"
+            )
+        else:
+            failed.append(result)
+            click.echo(f"FAILED {job.input_filename}: {result.error}")
+
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f"converted {len(jobs) - len(failed)} of {len(jobs)} maps in {elapsed:.2f}s "
+        f"({len(jobs) / elapsed:.1f} maps/s, "
+        f"{input_bytes / elapsed / 1024 / 1024:.2f} MB/s of TSV, "
+        f"{output_bytes / 1024 / 1024:.2f} MB written)"
+    )
+    for result in failed:
+        click.echo(f"failed: {result.job.input_filename}")
+    if failed:
+        raise SystemExit(1)
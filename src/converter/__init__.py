@@ -0,0 +1,330 @@
+# turns a Dungeon into a DPS Map
+
+import itertools
+import random
+
+from src.converter.scatter import FA_DUNGEON_SCATTER, check_scatter, place
+from src.dps import Location, Map, Size, TextureSet, load_catalog
+from src.dungeon import Dungeon, load_donjon_tsv, stream_donjon_tsv
+from src.dungeon.mesh import merge_rectangles
+from src.dungeon.rules import FA_DUNGEON_RULES, RuleSet
+
+# size of a dungeon cell in DPS units
+CELL_SIZE = 2
+
+# the texture catalog converters use unless given another
+TEXTURES_FILENAME = "fa_dungeon_textures.json"
+
+
+# The generators picking the texture variants of a map's cells: one per map
+# row, each seeded from one number drawn from the map's generator, so the rows
+# can be drawn in any order, or in other processes, and pick the same variants.
+class RowRandom:
+    def __init__(self, rng: random.Random):
+        self.base = rng.getrandbits(64)
+
+    def row(self, y: int) -> random.Random:
+        return random.Random(self.base + y)
+
+    # the generator of the merged floor plots, which can span many rows
+    def floors(self) -> random.Random:
+        return random.Random(self.base - 1)
+
+
+class Converter:
+    # merge_floors draws whole-cell floor plots with the same texture and
+    # bunch as one plot per rectangle instead of one plot per cell.
+    # scatter is the Decorations scattered over room interiors. Each map is
+    # drawn with a generator seeded with seed, so a seeded converter gives the
+    # same map every time; without a seed every map is different. Unless
+    # verbose is False, the size of each map is printed as it is loaded.
+    def __init__(
+        self,
+        textures_filename: str = TEXTURES_FILENAME,
+        rules: RuleSet = FA_DUNGEON_RULES,
+        merge_floors: bool = False,
+        scatter=FA_DUNGEON_SCATTER,
+        seed: int = None,
+        verbose: bool = True,
+    ):
+        check_scatter(scatter, load_catalog(textures_filename))
+
+        self.textures_filename = textures_filename
+        self.rules = rules
+        self.merge_floors = merge_floors
+        self.scatter = tuple(scatter)
+        self.seed = seed
+        self.verbose = verbose
+
+    # the generator of one map, which seeds its RowRandom and then places the
+    # decorations
+    def new_random(self) -> random.Random:
+        return random.Random(self.seed)
+
+    # the texture catalog is cached by load_catalog, so every map converted
+    # in the same process after the first gets it without parsing
+    def _setup(self, map_class=Map):
+        rng = self.new_random()
+        map = map_class()
+        catalog = load_catalog(self.textures_filename)
+        textures = TextureSet(map, catalog=catalog, rng=rng)
+        return map, textures, RowRandom(rng), rng
+
+    # With parallel, the cells are drawn on a pool of workers processes; the
+    # map comes out the same either way. With objects, the cells each object
+    # was drawn for are recorded in it as draw_cells does, and decorations are
+    # recorded in decorations as draw_decorations does.
+    def convert(
+        self,
+        dungeon: Dungeon,
+        parallel=False,
+        workers=None,
+        objects=None,
+        decorations=None,
+    ) -> Map:
+        if objects is not None and parallel:
+            raise ValueError("objects are only tracked for serial conversions")
+
+        map, textures, rows, rng = self._setup()
+        bunches = {name: map.add_bunch(name) for name in self.rules.bunches}
+
+        if parallel:
+            # the process pool is slow to import and only needed here
+            from src.converter.tiled import draw_cells_parallel
+
+            draw_cells_parallel(self, map, textures, rows, bunches, dungeon, workers)
+        else:
+            self.draw_cells(map, textures, rows, bunches, dungeon, objects)
+        in_room = dungeon.classify()["in_room"]
+        self.draw_decorations(
+            map, textures, rng, bunches["Floor"], in_room, decorations
+        )
+
+        return map
+
+    # Convert a donjon TSV file a row at a time, reading three rows at once
+    # and spilling emitted objects to disk, and write the document to fp.
+    # Returns the map, which is closed by then.
+    # Memory use depends on the width of the map rather than its area.
+    # Merged floors only merge along each row.
+    def stream(self, filename: str, fp, indent=2):
+        map = self._stream(filename)
+        try:
+            map.write(fp, indent)
+        finally:
+            map.close()
+
+        return map
+
+    # the streamed map of a donjon TSV file, still open for writing
+    def _stream(self, filename: str):
+        from src.dps.stream import StreamingMap
+
+        map, textures, rows, rng = self._setup(StreamingMap)
+        try:
+            bunches = {name: map.add_bunch(name) for name in self.rules.bunches}
+            floors_rng = rows.floors()
+
+            for y, window in stream_donjon_tsv(filename, self.verbose):
+                floors = [None] * window.width
+                self.draw_row(map, textures, rows.row(y), bunches, window, 1, y, floors)
+                if self.merge_floors:
+                    self.draw_floors(map, textures, floors_rng, bunches, [floors], y)
+
+                cells = window.classify()["in_room"]
+                cells = [(x, y) for x, row in cells if row == 1]
+                self.draw_decorations(map, textures, rng, bunches["Floor"], cells)
+        except BaseException:
+            map.close()
+            raise
+
+        return map
+
+    # Convert a donjon TSV file and save it as a .dps file with encoder, one of
+    # encoders.ENCODERS. Returns the map and the Encoded report of the save.
+    def convert_file(
+        self,
+        input_filename: str,
+        output_filename: str,
+        indent=2,
+        stream=False,
+        encoder="json",
+    ):
+        if stream:
+            map = self._stream(input_filename)
+            try:
+                return map, map.save(output_filename, encoder, indent)
+            finally:
+                map.close()
+
+        map = self.convert(load_donjon_tsv(input_filename, self.verbose))
+        return map, map.save(output_filename, encoder, indent)
+
+    # With objects, an (object_id, x, y, width, height) tuple is appended to
+    # it for every object drawn, giving the cells the object was drawn for.
+    def draw_cells(
+        self,
+        map: Map,
+        textures: TextureSet,
+        rows: RowRandom,
+        bunches,
+        dungeon: Dungeon,
+        objects=None,
+    ):
+        floors = [[None] * dungeon.width for _ in range(dungeon.height)]
+        for y in range(dungeon.height):
+            rng = rows.row(y)
+            self.draw_row(
+                map, textures, rng, bunches, dungeon, y, y, floors[y], objects
+            )
+
+        if self.merge_floors:
+            self.draw_floors(map, textures, rows.floors(), bunches, floors, 0, objects)
+
+    # Draw row y of the dungeon as row map_y of the map, picking texture
+    # variants with rng. When merging floors, whole-cell floor plots are
+    # collected in floors instead of being drawn.
+    def draw_row(
+        self,
+        map: Map,
+        textures: TextureSet,
+        rng: random.Random,
+        bunches,
+        dungeon: Dungeon,
+        y: int,
+        map_y: int,
+        floors,
+        objects=None,
+    ):
+        table = self.rules.compile()
+        for x in range(dungeon.width):
+            drawn = self.draw_cell(
+                map, textures, rng, bunches, dungeon, table, x, y, map_y, floors
+            )
+            if objects is not None:
+                objects.extend((object_id, x, map_y, 1, 1) for object_id in drawn)
+
+    # draw the cell at x, y as the cell at x, map_y and return the object IDs
+    def draw_cell(
+        self,
+        map: Map,
+        textures: TextureSet,
+        rng: random.Random,
+        bunches,
+        dungeon: Dungeon,
+        table,
+        x: int,
+        y: int,
+        map_y: int,
+        floors,
+    ):
+        emits = self.rules.tiles.get(dungeon.get_tile(x, y), ())
+        if self.merge_floors:
+            emits = self._defer_floor(emits, floors, x)
+        drawn = draw(map, textures, rng, bunches, emits, x, map_y)
+
+        if dungeon.tile_empty(x, y):
+            emits = table[dungeon.neighbourhood(x, y)]
+            drawn += draw(map, textures, rng, bunches, emits, x, map_y)
+
+        return drawn
+
+    # draw collected floor cells as rectangles, the first row being map row top
+    def draw_floors(
+        self,
+        map: Map,
+        textures: TextureSet,
+        rng: random.Random,
+        bunches,
+        floors,
+        top: int,
+        objects=None,
+    ):
+        # runs of rectangles in the same bunch are added in one call
+        rects = merge_rectangles(floors)
+        for bunch, run in itertools.groupby(rects, key=lambda rect: rect[4][1]):
+            xs, ys, widths, heights, emits = zip(*run)
+            plot_ids = map.add_plots(
+                [x * CELL_SIZE for x in xs],
+                [(top + y) * CELL_SIZE for y in ys],
+                [width * CELL_SIZE for width in widths],
+                [height * CELL_SIZE for height in heights],
+                [textures.get(texture, rng) for texture, _ in emits],
+                bunches[bunch],
+            )
+            if objects is not None:
+                objects.extend(
+                    (plot_id, x, top + y, width, height)
+                    for plot_id, x, y, width, height in zip(
+                        plot_ids, xs, ys, widths, heights
+                    )
+                )
+
+    # hold back the plot covering the whole cell so it can be merged, and
+    # return the emits that still need drawing
+    def _defer_floor(self, emits, floor_row, x: int):
+        remaining = []
+        for e in emits:
+            if floor_row[x] is None and is_floor(e):
+                floor_row[x] = (e.texture, e.bunch)
+            else:
+                remaining.append(e)
+        return remaining
+
+    # Scatter decorations over the (x, y) room interior cells, drawing every
+    # roll from rng at once. With decorations, an (object_id, x, y) tuple is
+    # appended to it for each one.
+    def draw_decorations(
+        self,
+        map: Map,
+        textures: TextureSet,
+        rng: random.Random,
+        bunch_id: int,
+        cells,
+        decorations=None,
+    ):
+        placed = place(rng, cells, self.scatter)
+        if not placed:
+            return
+
+        xs, ys, names, angles = zip(*placed)
+        obstacle_ids = map.add_obstacles(
+            [x * CELL_SIZE for x in xs],
+            [y * CELL_SIZE for y in ys],
+            [textures.get(texture) for texture in names],
+            bunch_id,
+            angles,
+        )
+        if decorations is not None:
+            decorations.extend(zip(obstacle_ids, xs, ys))
+
+
+# a plot that covers its whole cell
+def is_floor(e) -> bool:
+    return (
+        e.kind == "plot"
+        and e.x == 0
+        and e.y == 0
+        and e.width == CELL_SIZE
+        and e.height == CELL_SIZE
+    )
+
+
+# draw the rule emits for the cell at x, y and return the object IDs
+def draw(map: Map, textures: TextureSet, rng, bunches, emits, x: int, y: int):
+    drawn = []
+    for e in emits:
+        location = Location(x * CELL_SIZE + e.x, y * CELL_SIZE + e.y)
+        if e.kind == "plot":
+            object_id = map.add_plot(
+                location,
+                Size(e.width, e.height),
+                textures.get(e.texture, rng),
+                bunches[e.bunch],
+            )
+        else:
+            object_id = map.add_obstacle(
+                location, textures.get(e.texture, rng), bunches[e.bunch], angle=e.angle
+            )
+        drawn.append(object_id)
+    return drawn
@@ -0,0 +1,138 @@
+# converts many donjon files across a pool of worker processes
+
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from src.converter import Converter
+from src.converter.cache import OutputCache
+from src.converter.cache import convert_file as cached_convert_file
+
+GLOB_CHARACTERS = "*?["
+
+
+class Job(NamedTuple):
+    input_filename: str
+    output_filename: str
+
+
+class Result(NamedTuple):
+    job: Job
+    error: Optional[str]
+    seconds: float
+    input_bytes: int
+    cached: bool = False
+    output_bytes: int = 0
+
+
+# Work out which files to convert. inputs is a directory (every .tsv file in
+# it), a glob pattern, or a manifest file listing one input per line with an
+# optional output file after a tab; relative paths in a manifest are relative
+# to the manifest, and lines starting with # are ignored. Outputs default to
+# the input name with suffix instead of its own inside output_dir. Raises
+# ValueError if two inputs would be written to the same output.
+def find_jobs(inputs: str, output_dir: str, suffix: str = ".dps"):
+    if os.path.isdir(inputs):
+        pairs = [(str(path), None) for path in sorted(Path(inputs).glob("*.tsv"))]
+    elif any(c in inputs for c in GLOB_CHARACTERS):
+        pairs = [(path, None) for path in sorted(glob.glob(inputs, recursive=True))]
+    else:
+        pairs = _read_manifest(inputs)
+
+    jobs = []
+    for input_filename, output_filename in pairs:
+        if output_filename is None:
+            output_filename = Path(input_filename).stem + suffix
+        jobs.append(Job(input_filename, os.path.join(output_dir, output_filename)))
+
+    inputs_by_output = {}
+    for job in jobs:
+        output = os.path.normpath(job.output_filename)
+        other = inputs_by_output.get(output)
+        if other is not None:
+            raise ValueError(
+                f"{other} and {job.input_filename} would both be written to "
+                f"{job.output_filename}; list them in a manifest with their own "
+                "output names"
+            )
+        inputs_by_output[output] = job.input_filename
+
+    return jobs
+
+
+def _read_manifest(filename: str):
+    base = Path(filename).parent
+    pairs = []
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            input_filename, _, output_filename = line.partition("\t")
+            pairs.append((str(base / input_filename), output_filename or None))
+    return pairs
+
+
+# each worker process keeps one converter, and so one parsed template and
+# texture catalog, for every file it is given
+_converter = None
+_options = None
+_cache = None
+
+
+def _start_worker(settings, options, cache):
+    global _converter, _options, _cache
+    # the workers share stdout with the summary, so they load quietly
+    _converter = Converter(**settings, verbose=False)
+    _options = options
+    if cache is not None:
+        _cache = OutputCache(**cache)
+
+
+def _convert(job: Job) -> Result:
+    started = time.perf_counter()
+    cached = False
+    try:
+        if _cache is None:
+            _converter.convert_file(job.input_filename, job.output_filename, **_options)
+        else:
+            cached = cached_convert_file(
+                _converter, _cache, job.input_filename, job.output_filename, **_options
+            )
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    input_bytes, output_bytes = (
+        _size(filename) for filename in (job.input_filename, job.output_filename)
+    )
+    return Result(
+        job, error, time.perf_counter() - started, input_bytes, cached, output_bytes
+    )
+
+
+def _size(filename: str) -> int:
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+# Convert every job on a pool of workers. settings are Converter keyword
+# arguments and options are convert_file keyword arguments. cache is the
+# OutputCache keyword arguments, or None to convert every map. Results are
+# yielded as conversions finish.
+def convert_batch(jobs, settings=None, options=None, workers=None, cache=None):
+    settings = settings or {}
+    options = options or {}
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_start_worker,
+        initargs=(settings, options, cache),
+    ) as pool:
+        futures = [pool.submit(_convert, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,162 @@
+# keeps converted .dps files on disk, keyed by everything that decides them
+#
+# The key is a hash of the TSV bytes, the texture catalog bytes, the rules,
+# the converter settings including the random seed, the output options and
+# the converter's own source, so a change to the code never returns outputs
+# cached by the code before it. Only seeded conversions are cached, as an
+# unseeded one is meant to come out different every time. A hit copies the
+# stored file to the output without parsing the map at all.
+# Every hit refreshes the entry's modification time, and when the cache grows
+# past its size limit the entries used longest ago are deleted first.
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+# the package whose source goes into every key
+SOURCE_DIRECTORY = Path(__file__).resolve().parents[1]
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def default_directory() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return os.path.join(os.path.expanduser(base), "dps-converter")
+
+
+class OutputCache:
+    def __init__(self, directory: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    # The key of converting input_filename with converter, options being the
+    # convert_file keyword arguments that change the output
+    def key(self, input_filename: str, converter, options=None) -> str:
+        digest = hashlib.sha256()
+        description = {
+            "source": source_digest(),
+            "settings": {
+                "merge_floors": converter.merge_floors,
+                "scatter": converter.scatter,
+                "seed": converter.seed,
+            },
+            "rules": repr((converter.rules.tiles, converter.rules.compile())),
+            "options": options or {},
+        }
+        digest.update(json.dumps(description, sort_keys=True).encode())
+        for filename in (converter.textures_filename, input_filename):
+            digest.update(b"\0")
+            _hash_file(digest, filename)
+        return digest.hexdigest()
+
+    # copy the entry for key to output_filename, returning whether there was one
+    def get(self, key: str, output_filename: str) -> bool:
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, output_filename)
+        except FileNotFoundError:
+            return False
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process since the copy
+            pass
+        return True
+
+    # store a copy of output_filename under key, then shrink the cache to
+    # its size limit
+    def put(self, key: str, output_filename: str):
+        temporary = f"{self._path(key)}.{os.getpid()}.tmp"
+        try:
+            shutil.copyfile(output_filename, temporary)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+        self.evict()
+
+    # delete the least recently used entries until the cache fits
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as found:
+            for entry in found:
+                if not entry.name.endswith(".dps"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".dps")
+
+
+_source_digest = None
+
+
+# a hash of every Python file of the converter, computed once per process
+def source_digest() -> str:
+    global _source_digest
+    if _source_digest is None:
+        digest = hashlib.sha256()
+        for path in sorted(SOURCE_DIRECTORY.rglob("*.py")):
+            digest.update(str(path.relative_to(SOURCE_DIRECTORY)).encode() + b"\0")
+            _hash_file(digest, path)
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+# whether conversions with converter can be cached
+def cacheable(converter) -> bool:
+    return converter.seed is not None
+
+
+def _hash_file(digest, filename: str, chunk: int = 1024 * 1024):
+    with open(filename, "rb") as f:
+        while True:
+            data = f.read(chunk)
+            if not data:
+                return
+            digest.update(data)
+
+
+# Convert input_filename with converter unless the cache already has the
+# result. options are convert_file keyword arguments. Returns whether the
+# output came from the cache.
+def convert_file(
+    converter,
+    cache: OutputCache,
+    input_filename: str,
+    output_filename: str,
+    **options,
+) -> bool:
+    if not cacheable(converter):
+        converter.convert_file(input_filename, output_filename, **options)
+        return False
+
+    key = cache.key(input_filename, converter, options)
+    if cache.get(key, output_filename):
+        return True
+
+    converter.convert_file(input_filename, output_filename, **options)
+    cache.put(key, output_filename)
+    return False
@@ -0,0 +1,227 @@
+# re-converts only the cells of a map that changed since its last conversion
+#
+# A conversion can write a cell index next to its output: the bunch IDs it
+# used, the rectangle of cells every object was drawn for, and the cell of
+# every decoration. When the map is edited, the old and new grids are
+# compared and every cell that changed, together with its 8 neighbours whose
+# walls depend on it, is drawn again. Objects drawn for those cells are
+# removed first and their IDs are reused. Decorations are only removed from
+# cells that changed or stopped being room interior, and only cells that
+# became room interior get new ones; everything else is left as it was.
+
+import json
+
+from src.converter import RowRandom
+from src.dps import Map, TextureSet, load_catalog
+from src.dungeon import Dungeon, load_donjon_tsv
+
+CELLS_SUFFIX = ".cells"
+
+
+class CellIndexError(Exception):
+    pass
+
+
+def cells_filename(output_filename: str) -> str:
+    return output_filename + CELLS_SUFFIX
+
+
+def write_cells(
+    filename: str, converter, dungeon: Dungeon, bunches, objects, decorations
+):
+    index = {
+        "width": dungeon.width,
+        "height": dungeon.height,
+        "settings": _settings(converter),
+        "bunches": bunches,
+        "objects": objects,
+        "decorations": decorations,
+    }
+    with open(filename, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+
+
+def read_cells(filename: str, converter):
+    try:
+        with open(filename) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        raise CellIndexError(
+            f"{filename} is missing; convert the previous map with a cell index"
+        ) from None
+
+    if index["settings"] != _settings(converter):
+        raise CellIndexError(
+            f"{filename} was written with different settings {index['settings']}"
+        )
+    return index
+
+
+def _settings(converter):
+    return {"merge_floors": converter.merge_floors}
+
+
+# convert a map, returning it with the bunches, objects and decorations of its
+# cell index
+def convert(converter, dungeon: Dungeon):
+    objects = []
+    decorations = []
+    map = converter.convert(dungeon, objects=objects, decorations=decorations)
+    bunches = {
+        name: map.get_bunch_by_name(name)["id"] for name in converter.rules.bunches
+    }
+    return map, bunches, objects, decorations
+
+
+# Redraw the cells that differ between previous and dungeon in map, which
+# was converted from previous with the given cell index. Returns the objects
+# and decorations of the index for the updated map.
+def update(converter, map: Map, index, previous: Dungeon, dungeon: Dungeon):
+    if (previous.width, previous.height) != (dungeon.width, dungeon.height):
+        raise CellIndexError("the map changed size and has to be converted again")
+    if (index["width"], index["height"]) != (dungeon.width, dungeon.height):
+        raise CellIndexError("the cell index is for a map of a different size")
+
+    changed = _changed_cells(previous, dungeon)
+    affected = _neighbours(changed, dungeon)
+    was_in_room = set(_in_room(previous))
+    in_room = _in_room(dungeon)
+    now_in_room = set(in_room)
+
+    # merged floors can cover cells that did not change, which then need
+    # their floor drawn again
+    removing = []
+    objects = []
+    refloor = set()
+    for entry in index["objects"]:
+        object_id, x, y, width, height = entry
+        cells = [(x + i, y + j) for j in range(height) for i in range(width)]
+        if affected.isdisjoint(cells):
+            objects.append(entry)
+        else:
+            removing.append(object_id)
+            refloor.update(cells)
+
+    decorations = []
+    for entry in index["decorations"]:
+        object_id, x, y = entry
+        if (x, y) in changed or (x, y) not in now_in_room:
+            removing.append(object_id)
+        else:
+            decorations.append(entry)
+    map.remove_objects(removing)
+
+    rng = converter.new_random()
+    catalog = load_catalog(converter.textures_filename)
+    textures = TextureSet(map, catalog=catalog, rng=rng)
+    rows = RowRandom(rng)
+    bunches = index["bunches"]
+    table = converter.rules.compile()
+    floors = {}
+    row_rng = None
+    for x, y in sorted(affected, key=_row_major):
+        if y not in floors:
+            row_rng = rows.row(y)
+        floor_row = floors.setdefault(y, [None] * dungeon.width)
+        drawn = converter.draw_cell(
+            map, textures, row_rng, bunches, dungeon, table, x, y, y, floor_row
+        )
+        objects.extend((object_id, x, y, 1, 1) for object_id in drawn)
+
+    if converter.merge_floors:
+        for x, y in sorted(refloor - affected, key=_row_major):
+            floor_row = floors.setdefault(y, [None] * dungeon.width)
+            emits = converter.rules.tiles.get(dungeon.get_tile(x, y), ())
+            converter._defer_floor(emits, floor_row, x)
+
+        if floors:
+            top = min(floors)
+            floor_rows = [
+                floors.get(y, [None] * dungeon.width)
+                for y in range(top, max(floors) + 1)
+            ]
+            converter.draw_floors(
+                map, textures, rows.floors(), bunches, floor_rows, top, objects
+            )
+
+    cells = [cell for cell in in_room if cell in changed or cell not in was_in_room]
+    converter.draw_decorations(map, textures, rng, bunches["Floor"], cells, decorations)
+
+    return objects, decorations
+
+
+def _changed_cells(previous: Dungeon, dungeon: Dungeon):
+    changed = set()
+    for y in range(dungeon.height):
+        old, new = previous.get_row(y), dungeon.get_row(y)
+        if old != new:
+            changed.update((x, y) for x in range(dungeon.width) if old[x] != new[x])
+    return changed
+
+
+def _in_room(dungeon: Dungeon):
+    return dungeon.classify()["in_room"]
+
+
+# the cells and their 8 neighbours that are on the map
+def _neighbours(cells, dungeon: Dungeon):
+    found = set()
+    for x, y in cells:
+        for j in range(max(y - 1, 0), min(y + 2, dungeon.height)):
+            for i in range(max(x - 1, 0), min(x + 2, dungeon.width)):
+                found.add((i, j))
+    return found
+
+
+def _row_major(cell):
+    return cell[1], cell[0]
+
+
+# Convert a donjon TSV file, saving the .dps file with encoder and writing its
+# cell index. Returns the map and the Encoded report of the save.
+def convert_file(
+    converter, input_filename: str, output_filename: str, indent=2, encoder="json"
+):
+    dungeon = load_donjon_tsv(input_filename)
+    map, bunches, objects, decorations = convert(converter, dungeon)
+    encoded = map.save(output_filename, encoder, indent)
+    write_cells(
+        cells_filename(output_filename),
+        converter,
+        dungeon,
+        bunches,
+        objects,
+        decorations,
+    )
+    return map, encoded
+
+
+# Update previous_output, converted with a cell index from previous_input,
+# for the edited map in input_filename, saving the .dps file with encoder and
+# writing its cell index to output_filename, which may be previous_output.
+# Returns the map and the Encoded report of the save.
+def update_file(
+    converter,
+    previous_input: str,
+    previous_output: str,
+    input_filename: str,
+    output_filename: str,
+    indent=2,
+    encoder="json",
+):
+    index = read_cells(cells_filename(previous_output), converter)
+    previous = load_donjon_tsv(previous_input)
+    dungeon = load_donjon_tsv(input_filename)
+    map = Map.load(previous_output)
+
+    objects, decorations = update(converter, map, index, previous, dungeon)
+    encoded = map.save(output_filename, encoder, indent)
+    write_cells(
+        cells_filename(output_filename),
+        converter,
+        dungeon,
+        index["bunches"],
+        objects,
+        decorations,
+    )
+    return map, encoded
@@ -0,0 +1,157 @@
+# records where the time goes in a conversion
+#
+# A Profile times named stages, and while watching it swaps the Map, Dungeon,
+# IdAllocator and TextureSet methods for wrappers that count their calls and add up the
+# time spent in them. Call times include the calls they make, so add_plot
+# includes its get_bunch_by_id lookup. The wrappers are only in place inside
+# watching(), so conversions that are not profiled pay nothing for them.
+
+import functools
+import sys
+import time
+from contextlib import contextmanager
+
+from src.dps import Map, TextureSet
+from src.dps.allocator import IdAllocator
+from src.dungeon import Dungeon
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+WATCHED = (
+    (
+        Map,
+        (
+            "add_bunch",
+            "add_plot",
+            "add_obstacle",
+            "add_plots",
+            "add_obstacles",
+            "add_objects",
+            "add_texture",
+            "get_bunch_by_id",
+            "get_layer_by_id",
+            "get_data",
+            "get_json",
+            "write",
+            "save",
+        ),
+    ),
+    # neighbourhood is the rule table lookup of every empty cell
+    (Dungeon, ("neighbourhood", "classify")),
+    (IdAllocator, ("allocate", "allocate_many")),
+    (TextureSet, ("get",)),
+)
+
+
+class Profile:
+    def __init__(self):
+        self.stages = {}
+        self.calls = {}
+        self.objects = {}
+        self.cprofile = None
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0) + elapsed
+
+    # Count and time calls to the WATCHED functions until the block exits.
+    # With cprofile_filename, the block is also run under cProfile and the
+    # stats are dumped there for pstats or snakeviz.
+    @contextmanager
+    def watching(self, cprofile_filename: str = None):
+        originals = []
+        for owner, names in WATCHED:
+            for name in names:
+                original = owner.__dict__[name]
+                originals.append((owner, name, original))
+                label = f"{owner.__name__}.{name}"
+                setattr(owner, name, self._counted(label, original))
+
+        if cprofile_filename:
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        try:
+            yield self
+        finally:
+            if self.cprofile is not None:
+                self.cprofile.disable()
+                self.cprofile.dump_stats(cprofile_filename)
+            for owner, name, original in originals:
+                setattr(owner, name, original)
+
+    # note how many of each kind of object the map ended up with
+    def count(self, map: Map):
+        self.objects = map.count_objects()
+
+    def _counted(self, label: str, function):
+        calls = self.calls[label] = [0, 0.0]
+
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                calls[0] += 1
+                calls[1] += time.perf_counter() - started
+
+        return counted
+
+    def report(self):
+        return {
+            "stages": dict(self.stages),
+            "total": sum(self.stages.values()),
+            "calls": {
+                label: {"count": count, "seconds": seconds}
+                for label, (count, seconds) in self.calls.items()
+                if count
+            },
+            "objects": dict(self.objects),
+            "peak_memory_bytes": peak_memory(),
+        }
+
+    def summary(self) -> str:
+        report = self.report()
+        lines = ["stage            seconds"]
+        for name, seconds in report["stages"].items():
+            lines.append(f"{name:<16} {seconds:>8.3f}")
+        lines.append(f"{'total':<16} {report['total']:>8.3f}")
+
+        lines.append("")
+        lines.append(f"{'call':<32} {'count':>10} {'seconds':>9}")
+        for label, call in sorted(
+            report["calls"].items(), key=lambda item: -item[1]["seconds"]
+        ):
+            lines.append(f"{label:<32} {call['count']:>10} {call['seconds']:>9.3f}")
+
+        if report["objects"]:
+            lines.append("")
+            for kind, count in report["objects"].items():
+                lines.append(f"{kind:<16} {count:>8}")
+
+        peak = report["peak_memory_bytes"]
+        if peak is not None:
+            lines.append("")
+            lines.append(f"peak memory {peak / 1024 / 1024:.1f} MB")
+
+        return "\n".join(lines)
+
+
+# the most memory the process has held at once, or None if it cannot be told
+def peak_memory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes everywhere but macOS
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,66 @@
+# picks where decorations go on the room interior cells
+#
+# Every roll for a map is drawn in one call to the generator, and every angle
+# in another, so a seeded generator places the same decorations on every run.
+
+from typing import NamedTuple
+
+
+class Decoration(NamedTuple):
+    # a texture name from the texture catalog, and the chance that any one
+    # room interior cell gets it
+    texture: str
+    density: float
+
+
+FA_DUNGEON_SCATTER = (
+    Decoration("blood", 0.03),
+    Decoration("skeleton", 0.02),
+    Decoration("broken_weapon", 0.05),
+)
+
+# decorations are turned by a whole number of degrees
+ANGLES = range(359)
+
+
+# check the decorations make sense, and with catalog, a parsed texture
+# catalog, that each of them names a texture in it
+def check_scatter(scatter, catalog=None):
+    for decoration in scatter:
+        if catalog is not None and decoration.texture not in catalog:
+            raise ValueError(f"unknown decoration texture {decoration.texture!r}")
+        if decoration.density < 0:
+            raise ValueError(f"negative density for {decoration.texture}")
+    if sum(decoration.density for decoration in scatter) > 1:
+        raise ValueError("decoration densities add up to more than 1")
+
+
+# Decide which of the (x, y) cells get a decoration, using rng, a
+# random.Random. Returns (x, y, texture, angle) tuples in cell order.
+def place(rng, cells, scatter=FA_DUNGEON_SCATTER):
+    if not cells or not scatter:
+        return []
+
+    textures = [None] + [decoration.texture for decoration in scatter]
+    weights = [decoration.density for decoration in scatter]
+    weights.insert(0, 1 - sum(weights))
+    picks = rng.choices(textures, weights, k=len(cells))
+
+    chosen = [(cell, texture) for cell, texture in zip(cells, picks) if texture]
+    angles = rng.choices(ANGLES, k=len(chosen))
+    return [(x, y, texture, angle) for ((x, y), texture), angle in zip(chosen, angles)]
+
+
+# parse "blood=0.03,skeleton=0.02" into decorations; "none" gives none
+def parse_scatter(text: str):
+    if text.strip().lower() in ("", "none"):
+        return ()
+
+    scatter = []
+    for item in text.split(","):
+        texture, _, density = item.partition("=")
+        try:
+            scatter.append(Decoration(texture.strip(), float(density)))
+        except ValueError:
+            raise ValueError(f"expected texture=density, not {item!r}") from None
+    return tuple(scatter)
@@ -0,0 +1,145 @@
+# draws the cells of one big map across a pool of worker processes
+#
+# The map is cut into bands of whole rows. Each worker gets the rows of its
+# band plus one halo row above and below, which is all the neighbourhood rules
+# look at, and records what it draws in an ObjectStore. Texture variants are
+# picked in the worker with the generator of each map row, so a store holds
+# the real bunch IDs and only numbers each (texture, variant) it used in the
+# order they were first used; the worker also groups the rows by bunch.
+#
+# The main process then adds the bands in row order. For each band it turns
+# the band's (texture, variant) list into helper IDs, registering the ones
+# not in the map yet, and hands the store to Map.add_objects, which copies
+# its columns and extends the child lists of the bunches without a Python
+# loop over the objects. IDs, helpers and variants come out exactly as if the
+# rows had been drawn one by one.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from src.dps import load_catalog
+from src.dps.store import OBSTACLE, PLOT, ObjectStore
+from src.dungeon import Dungeon
+
+# rows per band at least, so small maps are not cut into slivers
+MIN_BAND_ROWS = 16
+
+# bands per worker, so a slow band does not hold up the whole pool
+BANDS_PER_WORKER = 4
+
+
+# stands in for a Map in a worker, recording objects into a store
+class _Recorder:
+    def __init__(self):
+        self.store = ObjectStore()
+
+    def add_plot(self, location, size, texture_id: int, parent_bunch_id: int):
+        self.store.append(
+            PLOT,
+            0,
+            0,
+            texture_id,
+            parent_bunch_id,
+            location.x,
+            location.y,
+            width=size.width,
+            height=size.height,
+        )
+
+    def add_obstacle(self, location, texture_id: int, parent_bunch_id: int, **kwargs):
+        self.store.append(
+            OBSTACLE,
+            0,
+            0,
+            texture_id,
+            parent_bunch_id,
+            location.x,
+            location.y,
+            angle=kwargs.get("angle", 0),
+        )
+
+
+# stands in for a TextureSet in a worker: picks variants as RandomTexture.get
+# does, and numbers each (name, variant) as it is first used
+class _TextureKeys:
+    def __init__(self, catalog):
+        self.keys = []
+        self._variants = {name: len(files) for name, files in catalog.items()}
+        self._indexes = {}
+
+    def get(self, name: str, rng) -> int:
+        key = (name, rng.randrange(0, self._variants[name]))
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = len(self.keys)
+            self.keys.append(key)
+        return index
+
+
+_converter = None
+_rows = None
+_bunches = None
+
+
+def _start_worker(converter, rows, bunches):
+    global _converter, _rows, _bunches
+    _converter, _rows, _bunches = converter, rows, bunches
+
+
+# band is (width, codes, top, rows, halo): the tile codes of the band rows and
+# their halo rows, the map row of the first band row, the number of band rows
+# and whether there is a halo row above
+def _draw_band(band):
+    width, codes, top, rows, halo = band
+    dungeon = Dungeon(width, len(codes) // width, verbose=False)
+    for y in range(dungeon.height):
+        dungeon.set_row(y, codes[y * width : (y + 1) * width])
+
+    recorder = _Recorder()
+    textures = _TextureKeys(load_catalog(_converter.textures_filename))
+    floors = [[None] * width for _ in range(rows)]
+    for y in range(rows):
+        _converter.draw_row(
+            recorder,
+            textures,
+            _rows.row(top + y),
+            _bunches,
+            dungeon,
+            halo + y,
+            top + y,
+            floors[y],
+        )
+
+    store = recorder.store
+    floors = floors if _converter.merge_floors else None
+    return store, textures.keys, store.rows_by_parent(), floors
+
+
+def _bands(dungeon: Dungeon, rows: int):
+    for top in range(0, dungeon.height, rows):
+        first = max(top - 1, 0)
+        last = min(top + rows + 1, dungeon.height)
+        codes = b"".join(dungeon.get_row(y) for y in range(first, last))
+        yield dungeon.width, codes, top, min(rows, dungeon.height - top), top - first
+
+
+# Draw every cell of the dungeon into the map as Converter.draw_cells does,
+# with the rule matching and texture picking spread over workers processes.
+def draw_cells_parallel(converter, map, textures, rows, bunches, dungeon, workers=None):
+    workers = workers or os.cpu_count() or 1
+    band_rows = max(-(-dungeon.height // (workers * BANDS_PER_WORKER)), MIN_BAND_ROWS)
+    floors = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_start_worker,
+        initargs=(converter, rows, bunches),
+    ) as pool:
+        bands = pool.map(_draw_band, _bands(dungeon, band_rows))
+        for store, keys, children, band_floors in bands:
+            helpers = [textures.variant(name, index) for name, index in keys]
+            map.add_objects(store, helpers, children)
+            if band_floors is not None:
+                floors.extend(band_floors)
+
+    if converter.merge_floors:
+        converter.draw_floors(map, textures, rows.floors(), bunches, floors, 0)
@@ -1,5 +1,22 @@
+import itertools
 import json
+import marshal
+import os
 import random
+from array import array
+
+from src.dps.allocator import IdAllocator
+from src.dps.encoders import Encoded, open_document, save_document
+from src.dps.reader import read_json
+from src.dps.store import OBSTACLE, PLOT, ObjectStore
+from src.dps.writer import dumps, write_json
+
+# the tables Map.add_map copies from one map into another
+MERGED_TABLES = ("Bunch", "Layer", "Plot", "Obstacle", "Wall", "TextureItemHelper")
+
+# map settings and effect presets, which a map keeps its own of when another
+# is added to it
+SETTINGS_TABLES = ("Location", "FxPreset")
 
 
 class Location:
@@ -15,11 +32,75 @@ class Size:
 
 
 class Map:
-    def __init__(self):
-        self._data = get_template()
-
-    def get_json(self):
-        return json.dumps(self._data, indent=2)
+    # template is a parsed DPS document to start from instead of the built-in
+    # one; it is copied, so one parsed template can seed many maps
+    def __init__(self, template=None):
+        if template is None:
+            self._data = get_template()
+        else:
+            self._data = marshal.loads(marshal.dumps(template))
+        self._objects = ObjectStore()
+        self._index_tables()
+
+    # Read a .dps file, as saved by any of the encoders, into a map that can be
+    # edited and added to. Very large files are parsed a record at a time.
+    @classmethod
+    def load(cls, filename: str):
+        with open_document(filename) as f:
+            document = read_json(f)
+
+        # the parsed document is new, so it is used as it is instead of copied
+        map = cls.__new__(cls)
+        map._data = document
+        map._objects = ObjectStore()
+        map._index_tables()
+        return map
+
+    def get_json(self, indent=2):
+        return dumps(self.get_data(), indent)
+
+    # stream the document to a file object table by table; the output is the
+    # same as get_json with the same indent. indent=None writes compact JSON.
+    def write(self, fp, indent=2):
+        write_json(self._document(), fp, indent)
+
+    # save the document to filename with one of encoders.ENCODERS, returning
+    # the bytes written and the time taken
+    def save(self, filename: str, encoder="json", indent=2) -> Encoded:
+        return save_document(self, filename, encoder, indent)
+
+    # the whole document as plain dicts and lists
+    def get_data(self):
+        document = self._document()
+        document["tables"] = {
+            name: list(table) for name, table in document["tables"].items()
+        }
+        return document
+
+    # the document with the Plot, Obstacle and Layer tables extended by
+    # generators over the object store
+    def _document(self):
+        tables = dict(self._data["tables"])
+        for name, rows in (
+            ("Layer", self._objects.layers()),
+            ("Obstacle", self._objects.obstacles()),
+            ("Plot", self._objects.plots()),
+        ):
+            tables[name] = itertools.chain(tables[name], rows)
+
+        return {**self._data, "tables": tables}
+
+    # number of records of each kind in the document
+    def count_objects(self):
+        tables = self._data["tables"]
+        return {
+            "bunch": len(tables["Bunch"]),
+            "layer": len(tables["Layer"]) + len(self._objects),
+            "plot": len(tables["Plot"]) + self._objects.kind.count(PLOT),
+            "obstacle": len(tables["Obstacle"]) + self._objects.kind.count(OBSTACLE),
+            "wall": len(tables["Wall"]),
+            "texture": len(tables["TextureItemHelper"]),
+        }
 
     # Add a Bunch to the root Bunch and return its ID
     def add_bunch(self, name):
@@ -34,8 +115,9 @@ class Map:
             "opacity": 100,
             "parent": 1,
         }
-        self._data["tables"]["Bunch"].append(layer)
         root = self.get_bunch_by_id(1)
+        self._data["tables"]["Bunch"].append(layer)
+        self._bunches[layer_id] = layer
         root["layers"].append(layer_id)
         return layer_id
 
@@ -43,27 +125,21 @@ class Map:
     def add_plot(
         self, location: Location, size: Size, texture_id: int, parent_bunch_id: int
     ):
-        # create the plot
-
+        bunch = self.get_bunch_by_id(parent_bunch_id)
         plot_id = self.get_next_object_id()
-        plot = {
-            "helper": texture_id,
-            "id": plot_id,
-            "isLocked": False,
-            "lockedX": 0,
-            "lockedY": 0,
-            "points": [
-                {"x": location.x, "y": location.y},
-                {"x": location.x + size.width, "y": location.y + size.height},
-            ],
-            "seed": 0,
-            "textureRotation": 0,
-            "textureScale": 1,
-            "textureShiftX": 0,
-            "textureShiftY": 0,
-        }
-        self._data["tables"]["Plot"].append(plot)
-        self.add_object_to_layer(parent_bunch_id, plot_id, "plot")
+        layer_id = self.get_next_bunch_id()
+        self._objects.append(
+            PLOT,
+            plot_id,
+            layer_id,
+            texture_id,
+            parent_bunch_id,
+            location.x,
+            location.y,
+            width=size.width,
+            height=size.height,
+        )
+        bunch["layers"].append(layer_id)
 
         return plot_id
 
@@ -72,29 +148,152 @@ class Map:
     ):
         angle = kwargs.get("angle", 0)
 
+        bunch = self.get_bunch_by_id(parent_bunch_id)
         obstacle_id = self.get_next_object_id()
-        obstacle = {
-            "angle": angle,
-            "begin": {"x": location.x, "y": location.y},
-            "flipH": False,
-            "flipV": False,
-            "helper": texture_id,
-            "id": obstacle_id,
-            "points": [],
-            "scale": 1,
-            "seed": 0,
-            "textureIndex": 0,
-            "ver": 1,
-            "x": 0,
-            "y": 0,
-        }
-
-        self._data["tables"]["Obstacle"].append(obstacle)
-        self.add_object_to_layer(parent_bunch_id, obstacle_id, "obstacle")
+        layer_id = self.get_next_bunch_id()
+        self._objects.append(
+            OBSTACLE,
+            obstacle_id,
+            layer_id,
+            texture_id,
+            parent_bunch_id,
+            location.x,
+            location.y,
+            angle=angle,
+        )
+        bunch["layers"].append(layer_id)
 
         return obstacle_id
 
+    # Add many plots to one bunch at once. x, y, width, height and texture_ids
+    # are sequences with an entry per plot, in DPS units like add_plot takes.
+    # Returns the plot IDs, which are the ones adding the plots one at a time
+    # would give.
+    def add_plots(self, x, y, width, height, texture_ids, parent_bunch_id: int):
+        return self._add_many(PLOT, x, y, texture_ids, parent_bunch_id, width, height)
+
+    # Add many obstacles to one bunch at once, like add_plots. angles is a
+    # sequence of angles, or None for none turned.
+    def add_obstacles(self, x, y, texture_ids, parent_bunch_id: int, angles=None):
+        return self._add_many(
+            OBSTACLE, x, y, texture_ids, parent_bunch_id, angle=angles
+        )
+
+    def _add_many(
+        self,
+        kind,
+        x,
+        y,
+        texture_ids,
+        parent_bunch_id,
+        width=None,
+        height=None,
+        angle=None,
+    ):
+        count = len(texture_ids)
+        zeros = array("d", [0]) * count
+        width, height, angle = (
+            zeros if column is None else column for column in (width, height, angle)
+        )
+        if any(len(column) != count for column in (x, y, width, height, angle)):
+            raise ValueError("every column needs one entry per object")
+
+        bunch = self.get_bunch_by_id(parent_bunch_id)
+        object_ids = self._object_ids.allocate_many(count)
+        layer_ids = self._bunch_ids.allocate_many(count)
+        self._objects.extend(
+            array("b", [kind]) * count,
+            object_ids,
+            layer_ids,
+            texture_ids,
+            array("q", [parent_bunch_id]) * count,
+            x,
+            y,
+            width,
+            height,
+            angle,
+        )
+        bunch["layers"].extend(layer_ids)
+
+        return object_ids
+
+    # Append every row of another ObjectStore, for instance one filled in a
+    # worker process, giving each object fresh IDs. The store's parent values
+    # are bunch IDs in this map and its helper values index helpers, the
+    # texture IDs in this map. children is the store's rows_by_parent(), for
+    # a caller that already has it.
+    def add_objects(self, store: ObjectStore, helpers, children=None):
+        if children is None:
+            children = store.rows_by_parent()
+        bunches = {bunch_id: self.get_bunch_by_id(bunch_id) for bunch_id in children}
+
+        # every column is copied by array.extend, without a Python loop
+        object_ids = self._object_ids.allocate_many(len(store))
+        layer_ids = self._bunch_ids.allocate_many(len(store))
+        self._objects.extend(
+            store.kind,
+            object_ids,
+            layer_ids,
+            map(helpers.__getitem__, store.helper),
+            store.parent,
+            store.x,
+            store.y,
+            store.width,
+            store.height,
+            store.angle,
+        )
+        for bunch_id, rows in children.items():
+            bunches[bunch_id]["layers"].extend(map(layer_ids.__getitem__, rows))
+
+    # Remove plots, obstacles and walls along with the layers holding them,
+    # and free their IDs so the next objects added can reuse them. Every call
+    # goes over the whole of the object and layer tables however few objects
+    # it removes, so remove objects in batches, one call per edit, rather than
+    # one call per object.
+    def remove_objects(self, object_ids):
+        removing = set(object_ids)
+        tables = self._data["tables"]
+        found = set()
+        for name in ("Plot", "Obstacle", "Wall"):
+            records = tables[name]
+            kept = [record for record in records if record["id"] not in removing]
+            if len(kept) != len(records):
+                found.update(r["id"] for r in records if r["id"] in removing)
+                tables[name] = kept
+
+        removed = []
+        if found:
+            kept = []
+            for layer in tables["Layer"]:
+                if layer.get("data") in found:
+                    removed.append((layer["id"], layer["parent"]))
+                    del self._layers[layer["id"]]
+                else:
+                    kept.append(layer)
+            tables["Layer"] = kept
+
+        for object_id, layer_id, parent in self._objects.remove(removing):
+            found.add(object_id)
+            removed.append((layer_id, parent))
+
+        missing = removing - found
+        if missing:
+            raise Exception(f"could not find object id {min(missing)}")
+
+        # each bunch only has its child list rebuilt once
+        layer_ids = {layer_id for layer_id, _ in removed}
+        for parent_id in {parent for _, parent in removed}:
+            children = self.get_bunch_by_id(parent_id)["layers"]
+            children[:] = [child for child in children if child not in layer_ids]
+
+        for layer_id in layer_ids:
+            self._bunch_ids.release(layer_id)
+        for object_id in found:
+            self._object_ids.release(object_id)
+
     def add_object_to_layer(self, parent_bunch_id, object_id, layer_name):
+        bunch = self.get_bunch_by_id(parent_bunch_id)
+
         # create a layer and add the object to it
         layer_id = self.get_next_bunch_id()
         layer = {
@@ -107,9 +306,9 @@ class Map:
             "parent": parent_bunch_id,
         }
         self._data["tables"]["Layer"].append(layer)
+        self._layers[layer_id] = layer
 
         # add the layer to the bunch
-        bunch = self.get_bunch_by_id(parent_bunch_id)
         bunch["layers"].append(layer_id)
 
     # add a texture helper and return it's ID
@@ -122,91 +321,315 @@ class Map:
         self._data["tables"]["TextureItemHelper"].append(texture)
         return texture_id
 
+    # Copy every bunch, layer, plot, obstacle and wall of another map into a
+    # new bunch of this one, moved by (x, y) DPS units, and return the new
+    # bunch's ID. Each of the source's tables is remapped in one pass, and
+    # texture helpers for paths this map already has are reused. Maps holding
+    # other kinds of object, such as lights or text, are refused.
+    def add_map(self, source: "Map", name: str, x=0, y=0):
+        tables = source.get_data()["tables"]
+        for table, records in tables.items():
+            if records and not _merged(table):
+                raise Exception(f"cannot add a map with {table} records")
+
+        # DPS writes whole numbers without a fraction, so keep 4.0 as 4
+        x, y = (int(v) if float(v).is_integer() else v for v in (x, y))
+        source_root = next(b for b in tables["Bunch"] if "parent" not in b)
+        bunch_id = self.add_bunch(name)
+
+        helpers = {}
+        texture_ids = self.get_texture_ids()
+        for helper in tables["TextureItemHelper"]:
+            path = helper["path"]
+            if path not in texture_ids:
+                texture_ids[path] = self.add_texture(path)
+            helpers[helper["id"]] = texture_ids[path]
+
+        bunches = [b for b in tables["Bunch"] if b is not source_root]
+        ids = dict(
+            zip(
+                itertools.chain(
+                    (bunch["id"] for bunch in bunches),
+                    (layer["id"] for layer in tables["Layer"]),
+                ),
+                self._bunch_ids.allocate_many(len(bunches) + len(tables["Layer"])),
+            )
+        )
+        ids[source_root["id"]] = bunch_id
+        objects = [tables[table] for table in ("Plot", "Obstacle", "Wall")]
+        object_ids = dict(
+            zip(
+                (record["id"] for records in objects for record in records),
+                self._object_ids.allocate_many(sum(len(r) for r in objects)),
+            )
+        )
+
+        def moved(point):
+            return {**point, "x": point["x"] + x, "y": point["y"] + y}
+
+        own = self._data["tables"]
+        self._bunches[bunch_id]["layers"] = [ids[i] for i in source_root["layers"]]
+        for bunch in bunches:
+            copy = {
+                **bunch,
+                "id": ids[bunch["id"]],
+                "parent": ids[bunch["parent"]],
+                "layers": [ids[i] for i in bunch["layers"]],
+            }
+            own["Bunch"].append(copy)
+            self._bunches[copy["id"]] = copy
+
+        for layer in tables["Layer"]:
+            copy = {**layer, "id": ids[layer["id"]], "parent": ids[layer["parent"]]}
+            if "data" in layer:
+                copy["data"] = object_ids[layer["data"]]
+                # layers are named after the object they hold, as in "plot 12"
+                kind, _, data = layer["name"].rpartition(" ")
+                if kind and data == str(layer["data"]):
+                    copy["name"] = f"{kind} {copy['data']}"
+            own["Layer"].append(copy)
+            self._layers[copy["id"]] = copy
+
+        for plot in tables["Plot"]:
+            own["Plot"].append(
+                {
+                    **plot,
+                    "helper": helpers[plot["helper"]],
+                    "id": object_ids[plot["id"]],
+                    "points": [moved(point) for point in plot["points"]],
+                }
+            )
+        for obstacle in tables["Obstacle"]:
+            own["Obstacle"].append(
+                {
+                    **obstacle,
+                    "begin": moved(obstacle["begin"]),
+                    "helper": helpers[obstacle["helper"]],
+                    "id": object_ids[obstacle["id"]],
+                    "points": [moved(point) for point in obstacle["points"]],
+                }
+            )
+        for wall in tables["Wall"]:
+            own["Wall"].append(
+                {
+                    **wall,
+                    "helper": helpers[wall["helper"]],
+                    "id": object_ids[wall["id"]],
+                    "points": [moved(point) for point in wall["points"]],
+                }
+            )
+
+        return bunch_id
+
+    # the IDs of the texture helpers already in the map, by path
+    def get_texture_ids(self):
+        helpers = self._data["tables"]["TextureItemHelper"]
+        return {helper["path"]: helper["id"] for helper in helpers}
+
     def get_bunch_by_id(self, bunch_id):
-        for bunch in self._data["tables"]["Bunch"]:
-            if bunch["id"] == bunch_id:
+        try:
+            return self._bunches[bunch_id]
+        except KeyError:
+            raise Exception(f"could not find bunch id {bunch_id}") from None
+
+    # the first bunch with the given name
+    def get_bunch_by_name(self, name):
+        for bunch in self._bunches.values():
+            if bunch["name"] == name:
                 return bunch
-
-        raise Exception(f"could not find bunch id {bunch_id}")
+        raise Exception(f"could not find bunch {name}")
+
+    # Layers of plots and obstacles live in the object store, so the record
+    # returned for those is a copy; use move_layers to change their parent.
+    def get_layer_by_id(self, layer_id):
+        if layer_id in self._layers:
+            return self._layers[layer_id]
+
+        row = self._objects.row_of_layer(layer_id)
+        if row is None:
+            raise Exception(f"could not find layer id {layer_id}")
+        return self._objects.layer(row)
+
+    # move layers to the end of another bunch, keeping their relative order
+    def move_layers(self, layer_ids, bunch_id):
+        target = self.get_bunch_by_id(bunch_id)
+        moving = list(dict.fromkeys(layer_ids))
+        parents = set()
+        rows = []
+        for layer_id in moving:
+            if layer_id in self._layers:
+                parents.add(self._layers[layer_id]["parent"])
+                continue
+
+            row = self._objects.row_of_layer(layer_id)
+            if row is None:
+                raise Exception(f"could not find layer id {layer_id}")
+            parents.add(self._objects.parent[row])
+            rows.append(row)
+
+        # each source bunch only has its child list rebuilt once
+        moved = set(moving)
+        for parent_id in parents:
+            children = self.get_bunch_by_id(parent_id)["layers"]
+            children[:] = [child for child in children if child not in moved]
+
+        for layer_id in moving:
+            if layer_id in self._layers:
+                self._layers[layer_id]["parent"] = bunch_id
+        for row in rows:
+            self._objects.parent[row] = bunch_id
+        target["layers"].extend(moving)
+
+    # list the IDs of every bunch and layer below a bunch, depth first
+    def get_subtree(self, bunch_id):
+        subtree = []
+        stack = [iter(self.get_bunch_by_id(bunch_id)["layers"])]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                continue
+
+            subtree.append(child)
+            if child in self._bunches:
+                stack.append(iter(self._bunches[child]["layers"]))
+
+        return subtree
+
+    # Bunch and Layer records keyed by ID. The records are the same dicts
+    # held in the tables, and a bunch's "layers" list is its child index.
+    # Layers in the object store are found through ObjectStore.row_of_layer.
+    # The ID allocators are seeded from the same pass over the tables.
+    def _index_tables(self):
+        tables = self._data["tables"]
+        self._bunches = {bunch["id"]: bunch for bunch in tables["Bunch"]}
+        self._layers = {layer["id"]: layer for layer in tables["Layer"]}
+        self._bunch_ids = IdAllocator(itertools.chain(self._bunches, self._layers))
+        self._object_ids = IdAllocator(
+            record["id"]
+            for name in ("Plot", "Obstacle", "Wall")
+            for record in tables[name]
+        )
+        self._helper_ids = IdAllocator(
+            helper["id"] for helper in tables["TextureItemHelper"]
+        )
 
     # bunch IDs are drawn from the same pool as layer IDs.
     def get_next_bunch_id(self):
-        ids = set([0])
-        for bunch in self._data["tables"]["Bunch"]:
-            ids.add(bunch["id"])
-
-        for layer in self._data["tables"]["Layer"]:
-            ids.add(layer["id"])
-
-        # I think if you have a million objects you have a problem
-        for i in range(1000000):
-            if i not in ids:
-                return i
+        return self._bunch_ids.allocate()
 
-        raise Exception("ran out of possible Bunch IDs")
-
-    # object IDs are drawn from Plot and Obstacle
+    # object IDs are drawn from Plot, Obstacle and Wall
     def get_next_object_id(self):
-        ids = set([0])
-        for plot in self._data["tables"]["Plot"]:
-            ids.add(plot["id"])
-
-        for obstacle in self._data["tables"]["Obstacle"]:
-            ids.add(obstacle["id"])
-
-        for i in range(1000000):
-            if i not in ids:
-                return i
-
-        raise Exception("ran out of possible Object IDs")
+        return self._object_ids.allocate()
 
     def get_next_helper_id(self):
-        ids = set([0])
-        for plot in self._data["tables"]["TextureItemHelper"]:
-            ids.add(plot["id"])
+        return self._helper_ids.allocate()
 
-        for i in range(1000000):
-            if i not in ids:
-                return i
 
-        raise Exception("ran out of possible TextureItemHelper IDs")
+def _merged(table: str) -> bool:
+    return table in MERGED_TABLES or table in SETTINGS_TABLES or table.endswith("Fx")
 
 
 class RandomTexture:
-    def __init__(self):
+    # Variants are helper IDs, or with register given, paths that are only
+    # turned into helpers by register the first time they are picked. They
+    # are picked with rng, a random.Random, or the random module by default.
+    def __init__(self, register=None, rng=None):
         self.textures = list()
-
-    def add(self, texture_id: int):
-        self.textures.append(texture_id)
-
-    def get(self):
-        return self.textures[random.randrange(0, len(self.textures))]
+        self._register = register
+        self._random = rng or random
+
+    def add(self, texture):
+        self.textures.append(texture)
+
+    # pick a variant with rng, or the generator given when this was made
+    def get(self, rng=None):
+        index = (rng or self._random).randrange(0, len(self.textures))
+        texture = self.textures[index]
+        if isinstance(texture, str):
+            texture = self.variant(index)
+        return texture
+
+    # the helper ID of the variant at index, registering it if it is a path
+    def variant(self, index: int):
+        texture = self.textures[index]
+        if isinstance(texture, str):
+            texture = self.textures[index] = self._register(texture)
+        return texture
 
     def dumps(self):
         return json.dumps(self.textures)
 
 
 class TextureSet:
-    def __init__(self, map: Map, filename: str):
+    # catalog is the already parsed texture file, if the caller has it.
+    # Helpers are added to the map as variants are first used, so textures
+    # the map never uses stay out of it, and a path listed under several
+    # names, or already in the map, gets one helper. rng picks the variants.
+    def __init__(self, map: Map, filename: str = None, catalog=None, rng=None):
         self.textures = dict()
+        self._map = map
+        self._helpers = map.get_texture_ids()
 
-        with open(filename) as f:
-            data = json.load(f)
+        if catalog is None:
+            catalog = load_catalog(filename)
 
-        for name, files in data.items():
-            self.textures[name] = RandomTexture()
+        for name, files in catalog.items():
+            self.textures[name] = RandomTexture(self._register, rng)
             for f in files:
-                self.textures[name].add(map.add_texture(f))
+                self.textures[name].add(f)
 
-    def get(self, name):
-        return self.textures[name].get()
+    def get(self, name, rng=None):
+        return self.textures[name].get(rng)
+
+    # the helper ID of the variant at index of a texture
+    def variant(self, name, index: int):
+        return self.textures[name].variant(index)
 
     def dump(self):
         for k, v in self.textures.items():
             print(f"{k}: {v.dumps()}")
 
+    def _register(self, path):
+        texture_id = self._helpers.get(path)
+        if texture_id is None:
+            texture_id = self._helpers[path] = self._map.add_texture(path)
+        return texture_id
+
+
+# parsed texture catalogs by file, kept for the life of the process
+_catalogs = {}
+
+
+# Parse a texture catalog, or return the copy parsed earlier if the file has
+# not changed since. The catalog is shared, so it must not be modified.
+def load_catalog(filename: str):
+    key = os.path.abspath(filename)
+    modified = os.stat(key).st_mtime_ns
+    cached = _catalogs.get(key)
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+
+    with open(key) as f:
+        catalog = json.load(f)
+    _catalogs[key] = (modified, catalog)
+    return catalog
+
+
+# The built-in template is parsed once and kept as marshal data, which turns
+# back into a fresh copy of the document in a single C call, several times
+# faster than parsing the JSON or deep copying the parsed document.
+_template = None
+
 
 def get_template():
+    global _template
+    if _template is None:
+        _template = marshal.dumps(_parse_template())
+    return marshal.loads(_template)
+
+
+def _parse_template():
     template = """{
     "tables": {
         "AbsFx": [],
@@ -0,0 +1,51 @@
+# hands out IDs for one of the DPS ID pools without rescanning the tables
+
+import heapq
+from typing import Iterable
+
+
+class IdAllocator:
+    # IDs start at 1; DPS never uses 0. Free IDs are handed out lowest first,
+    # so a freshly seeded allocator fills gaps in the template before it
+    # starts counting upwards from the highest ID in use.
+    def __init__(self, used: Iterable[int] = ()):
+        used = set(used)
+        used.discard(0)
+        self._next = max(used, default=0) + 1
+        self._free = [i for i in range(1, self._next) if i not in used]
+        heapq.heapify(self._free)
+
+    def allocate(self) -> int:
+        if self._free:
+            return heapq.heappop(self._free)
+
+        allocated = self._next
+        self._next += 1
+        return allocated
+
+    # Allocate count IDs at once, the same ones count calls to allocate()
+    # would give. Once the free list is used up the rest are one range.
+    def allocate_many(self, count: int):
+        allocated = []
+        while self._free and len(allocated) < count:
+            allocated.append(heapq.heappop(self._free))
+
+        start = self._next
+        self._next += count - len(allocated)
+        if not allocated:
+            return range(start, self._next)
+        allocated.extend(range(start, self._next))
+        return allocated
+
+    # return an ID to the pool so it can be handed out again
+    def release(self, allocated: int):
+        if allocated <= 0 or allocated >= self._next:
+            raise Exception(f"ID {allocated} was never allocated")
+
+        heapq.heappush(self._free, allocated)
+
+    # look at the ID the next call to allocate() will return
+    def peek(self) -> int:
+        if self._free:
+            return self._free[0]
+        return self._next
@@ -0,0 +1,97 @@
+# saves a DPS document to a file with one of several encoders
+#
+# "json" streams the document through the stdlib encoder table by table, so
+# the output is never held in memory as a whole. "gzip" streams it the same
+# way through gzip, for archiving converted maps; Dungeon Painter Studio
+# cannot open those files until they are decompressed. "fast" encodes the
+# whole document at once with orjson, which is several times faster than the
+# stdlib encoder, and falls back to "json" when orjson is not installed. All
+# of them write the same UTF-8 JSON for the same indent.
+
+import os
+import time
+from typing import NamedTuple, Optional
+
+ENCODERS = ("json", "gzip", "fast")
+
+# zlib's default; higher levels are much slower for little gain on DPS files
+GZIP_LEVEL = 6
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class Encoded(NamedTuple):
+    # the encoder that wrote the file, "orjson" or "json" for "fast"
+    encoder: str
+    bytes: int
+    seconds: float
+
+
+# the file name suffix for documents saved with encoder
+def suffix(encoder: str) -> str:
+    return ".dps.gz" if encoder == "gzip" else ".dps"
+
+
+def save_document(
+    map, filename: str, encoder: str = "json", indent: Optional[int] = 2
+) -> Encoded:
+    if encoder not in ENCODERS:
+        raise ValueError(f"unknown encoder {encoder}, expected one of {ENCODERS}")
+
+    started = time.perf_counter()
+    if encoder == "gzip":
+        _save_gzip(map, filename, indent)
+    elif encoder == "fast":
+        encoder = _save_fast(map, filename, indent)
+    else:
+        _save_json(map, filename, indent)
+    seconds = time.perf_counter() - started
+
+    return Encoded(encoder, os.path.getsize(filename), seconds)
+
+
+def _save_json(map, filename: str, indent: Optional[int]):
+    with open(filename, "w", encoding="utf-8") as f:
+        map.write(f, indent)
+
+
+def _save_gzip(map, filename: str, indent: Optional[int]):
+    import gzip
+    import io
+
+    with open(filename, "wb") as raw:
+        # no file name or time in the header, so the same map gives the same file
+        with gzip.GzipFile(
+            filename="", mode="wb", compresslevel=GZIP_LEVEL, fileobj=raw, mtime=0
+        ) as compressed:
+            with io.TextIOWrapper(compressed, encoding="utf-8") as f:
+                map.write(f, indent)
+
+
+# returns the name of the encoder that was used
+def _save_fast(map, filename: str, indent: Optional[int]) -> str:
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+    # orjson only indents by 2
+    if orjson is None or indent not in (None, 2):
+        _save_json(map, filename, indent)
+        return "json"
+
+    option = orjson.OPT_INDENT_2 if indent else 0
+    with open(filename, "wb") as f:
+        f.write(orjson.dumps(map.get_data(), option=option))
+    return "orjson"
+
+
+# open a saved document for reading as text, whichever encoder saved it
+def open_document(filename: str):
+    with open(filename, "rb") as f:
+        compressed = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+    if compressed:
+        import gzip
+
+        return gzip.open(filename, "rt", encoding="utf-8")
+    return open(filename, encoding="utf-8")
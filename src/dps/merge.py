@@ -0,0 +1,66 @@
+# stitches several maps into one DPS map
+#
+# Each level goes under a bunch of its own, moved by its offset, with its IDs
+# remapped by Map.add_map. Levels given as file names are loaded one at a
+# time, so only the merged map and one level are held in memory at once.
+
+from pathlib import Path
+from typing import NamedTuple, Union
+
+from src.dps import Map
+
+
+class Level(NamedTuple):
+    # a Map, or the name of a .dps file to load
+    source: Union[Map, str]
+    name: str
+    x: float = 0
+    y: float = 0
+
+
+def merge(levels, template=None) -> Map:
+    merged = Map(template)
+    for source, name, x, y in levels:
+        if isinstance(source, str):
+            source = Map.load(source)
+        merged.add_map(source, name, x, y)
+    return merged
+
+
+# Merge .dps files side by side in the given order, left to right or top to
+# bottom, gap DPS units apart. Each level is named after its file.
+def merge_files(filenames, gap: float = 4, vertical=False) -> Map:
+    merged = Map()
+    offset = 0
+    for filename in filenames:
+        level = Map.load(filename)
+        left, top, right, bottom = bounds(level) or (0, 0, 0, 0)
+        if vertical:
+            merged.add_map(level, level_name(filename), -left, offset - top)
+            offset += bottom - top + gap
+        else:
+            merged.add_map(level, level_name(filename), offset - left, -top)
+            offset += right - left + gap
+    return merged
+
+
+def level_name(filename: str) -> str:
+    name = Path(filename).name
+    for suffix in (".gz", ".dps"):
+        name = name.removesuffix(suffix)
+    return name
+
+
+# the (left, top, right, bottom) of the plots, obstacles and walls of a map,
+# or None if it has none; obstacles count only by where they begin
+def bounds(map: Map):
+    tables = map.get_data()["tables"]
+    points = [point for plot in tables["Plot"] for point in plot["points"]]
+    points += [obstacle["begin"] for obstacle in tables["Obstacle"]]
+    points += [point for wall in tables["Wall"] for point in wall["points"]]
+    if not points:
+        return None
+
+    xs = [point["x"] for point in points]
+    ys = [point["y"] for point in points]
+    return min(xs), min(ys), max(xs), max(ys)
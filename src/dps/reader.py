@@ -0,0 +1,127 @@
+# reads a DPS document from a file without loading its whole text at once
+#
+# The mirror of writer.py: the document, its "tables" object and each table
+# are read piece by piece, and everything deeper (a single record) is decoded
+# in one go with the stdlib decoder. The file is read a chunk at a time, so
+# besides the parsed document only about one chunk of text is held in memory
+# rather than the whole file.
+
+import json
+import re
+from typing import TextIO
+
+from src.dps.writer import STREAM_DEPTH
+
+CHUNK = 1024 * 1024
+
+WHITESPACE = " \t\n\r"
+
+_whitespace = re.compile(f"[{WHITESPACE}]*")
+_decoder = json.JSONDecoder()
+
+
+def read_json(fp: TextIO, chunk: int = CHUNK):
+    reader = _Reader(fp, chunk)
+    value = reader.value(0)
+    if reader.peek() != "":
+        reader.fail("extra data after the document")
+    return value
+
+
+class _Reader:
+    def __init__(self, fp: TextIO, chunk: int):
+        self.fp = fp
+        self.chunk = chunk
+        self.text = ""
+        self.pos = 0
+        # characters dropped from the front of text, for error positions
+        self.offset = 0
+        self.eof = False
+
+    # read another chunk onto the end of the text, returning False at the end
+    # of the file
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        data = self.fp.read(self.chunk)
+        if not data:
+            self.eof = True
+            return False
+
+        self.offset += self.pos
+        self.text = self.text[self.pos :] + data
+        self.pos = 0
+        return True
+
+    # the next character that is not whitespace, or "" at the end of the file
+    def peek(self) -> str:
+        if self.pos < len(self.text) and self.text[self.pos] not in WHITESPACE:
+            return self.text[self.pos]
+
+        while True:
+            self.pos = _whitespace.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            self.fail(f"expected {character!r}")
+        self.pos += 1
+
+    def fail(self, message: str, pos: int = None):
+        pos = self.pos if pos is None else pos
+        raise ValueError(f"{message} at character {self.offset + pos}") from None
+
+    def value(self, depth: int):
+        first = self.peek()
+        if depth < STREAM_DEPTH and first == "{":
+            return self._items(depth, "}", {})
+        if depth < STREAM_DEPTH and first == "[":
+            return self._items(depth, "]", [])
+        return self._decode()
+
+    def _items(self, depth: int, close: str, container):
+        self.pos += 1
+        if self.peek() == close:
+            self.pos += 1
+            return container
+
+        while True:
+            if close == "}":
+                key = self._decode()
+                if not isinstance(key, str):
+                    self.fail("expected a key")
+                self.expect(":")
+                container[key] = self.value(depth + 1)
+            else:
+                container.append(self.value(depth + 1))
+
+            following = self.peek()
+            if following != "," and following != close:
+                self.fail(f"expected ',' or {close!r}")
+            self.pos += 1
+            if following == close:
+                return container
+
+    # decode one value with the stdlib decoder, reading more of the file
+    # while the value might run on past the end of the text read so far
+    def _decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError as e:
+                if self.fill():
+                    continue
+                self.fail(e.msg, e.pos)
+
+            # a number cut off by the end of a chunk decodes as a shorter one,
+            # so a value has to be followed by a delimiter to be taken as is
+            following = _whitespace.match(self.text, end).end()
+            if following == len(self.text) or self.text[following] not in ",:]}":
+                if self.fill():
+                    continue
+            self.pos = following
+            return value
@@ -0,0 +1,205 @@
+# columnar storage for the Plot and Obstacle objects a Map emits
+
+from array import array
+
+PLOT = 0
+OBSTACLE = 1
+
+KIND_NAMES = {PLOT: "plot", OBSTACLE: "obstacle"}
+
+COLUMNS = (
+    "kind",
+    "object_id",
+    "layer_id",
+    "helper",
+    "parent",
+    "x",
+    "y",
+    "width",
+    "height",
+    "angle",
+)
+
+
+# DPS writes whole numbers without a fraction, so keep 4 as 4 rather than 4.0
+def _number(value: float):
+    if value.is_integer():
+        return int(value)
+    return value
+
+
+class ObjectStore:
+    # One row per emitted object: the object itself plus the Layer that
+    # holds it. Everything else in a Plot/Obstacle/Layer record is a constant
+    # default, so the dicts are only built when the map is serialized.
+    def __init__(self):
+        self.kind = array("b")
+        self.object_id = array("q")
+        self.layer_id = array("q")
+        self.helper = array("q")
+        self.parent = array("q")
+        self.x = array("d")
+        self.y = array("d")
+        self.width = array("d")
+        self.height = array("d")
+        self.angle = array("d")
+        self._layer_rows = None
+
+    def __len__(self):
+        return len(self.kind)
+
+    def append(
+        self,
+        kind,
+        object_id,
+        layer_id,
+        helper,
+        parent,
+        x,
+        y,
+        width=0,
+        height=0,
+        angle=0,
+    ) -> int:
+        row = len(self.kind)
+        self.kind.append(kind)
+        self.object_id.append(object_id)
+        self.layer_id.append(layer_id)
+        self.helper.append(helper)
+        self.parent.append(parent)
+        self.x.append(x)
+        self.y.append(y)
+        self.width.append(width)
+        self.height.append(height)
+        self.angle.append(angle)
+        if self._layer_rows is not None:
+            self._layer_rows[layer_id] = row
+        return row
+
+    # the rows of each parent, in row order
+    def rows_by_parent(self):
+        rows = {}
+        for row, parent in enumerate(self.parent):
+            found = rows.get(parent)
+            if found is None:
+                found = rows[parent] = array("q")
+            found.append(row)
+        return rows
+
+    # append many rows at once, each argument being a whole column of them
+    def extend(
+        self, kind, object_id, layer_id, helper, parent, x, y, width, height, angle
+    ):
+        row = len(self.kind)
+        for name, values in zip(
+            COLUMNS,
+            (kind, object_id, layer_id, helper, parent, x, y, width, height, angle),
+        ):
+            getattr(self, name).extend(values)
+        if self._layer_rows is not None:
+            self._layer_rows.update(zip(layer_id, range(row, len(self.kind))))
+
+    # write the columns to a binary file, one after the other
+    def dump(self, fp):
+        for name in COLUMNS:
+            getattr(self, name).tofile(fp)
+
+    # read back rows written by dump
+    @classmethod
+    def load(cls, fp, rows: int):
+        store = cls()
+        for name in COLUMNS:
+            getattr(store, name).fromfile(fp, rows)
+        return store
+
+    # Drop the rows of the given objects, returning the (object_id, layer_id,
+    # parent) of each row dropped. The remaining rows keep their order.
+    def remove(self, object_ids):
+        keep = [row for row, i in enumerate(self.object_id) if i not in object_ids]
+        if len(keep) == len(self):
+            return []
+
+        kept = set(keep)
+        removed = [
+            (self.object_id[row], self.layer_id[row], self.parent[row])
+            for row in range(len(self))
+            if row not in kept
+        ]
+        for name in COLUMNS:
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, [column[row] for row in keep]))
+        self._layer_rows = None
+        return removed
+
+    # the layer -> row index is only built once something asks for it, so
+    # plain emission never pays for it
+    def row_of_layer(self, layer_id):
+        if self._layer_rows is None:
+            self._layer_rows = {layer: row for row, layer in enumerate(self.layer_id)}
+        return self._layer_rows.get(layer_id)
+
+    def plot(self, row):
+        x = self.x[row]
+        y = self.y[row]
+        return {
+            "helper": self.helper[row],
+            "id": self.object_id[row],
+            "isLocked": False,
+            "lockedX": 0,
+            "lockedY": 0,
+            "points": [
+                {"x": _number(x), "y": _number(y)},
+                {
+                    "x": _number(x + self.width[row]),
+                    "y": _number(y + self.height[row]),
+                },
+            ],
+            "seed": 0,
+            "textureRotation": 0,
+            "textureScale": 1,
+            "textureShiftX": 0,
+            "textureShiftY": 0,
+        }
+
+    def obstacle(self, row):
+        return {
+            "angle": _number(self.angle[row]),
+            "begin": {"x": _number(self.x[row]), "y": _number(self.y[row])},
+            "flipH": False,
+            "flipV": False,
+            "helper": self.helper[row],
+            "id": self.object_id[row],
+            "points": [],
+            "scale": 1,
+            "seed": 0,
+            "textureIndex": 0,
+            "ver": 1,
+            "x": 0,
+            "y": 0,
+        }
+
+    def layer(self, row):
+        object_id = self.object_id[row]
+        return {
+            "choosingPreset": False,
+            "data": object_id,
+            "id": self.layer_id[row],
+            "invisible": False,
+            "name": f"{KIND_NAMES[self.kind[row]]} {object_id}",
+            "opacity": 100,
+            "parent": self.parent[row],
+        }
+
+    def plots(self):
+        for row, kind in enumerate(self.kind):
+            if kind == PLOT:
+                yield self.plot(row)
+
+    def obstacles(self):
+        for row, kind in enumerate(self.kind):
+            if kind == OBSTACLE:
+                yield self.obstacle(row)
+
+    def layers(self):
+        for row in range(len(self.kind)):
+            yield self.layer(row)
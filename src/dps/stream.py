@@ -0,0 +1,128 @@
+# a Map that keeps its memory flat by spilling emitted objects to disk
+
+import itertools
+import tempfile
+from array import array
+
+from src.dps import Map
+from src.dps.store import OBSTACLE, PLOT, ObjectStore
+from src.dps.writer import Streamed
+
+
+class StreamingMap(Map):
+    # Every flush_rows plots and obstacles, the object store and the layer ID
+    # lists of the bunches are moved out to temporary files and read back in
+    # chunks only while the document is written. Objects that have been moved
+    # out can no longer be looked up or moved between bunches.
+    def __init__(self, flush_rows: int = 65536, template=None):
+        super().__init__(template)
+        self.flush_rows = flush_rows
+        self._spool = tempfile.TemporaryFile()
+        self._chunks = []
+        self._bunch_spools = {}
+        self._spooled_counts = {"layer": 0, "plot": 0, "obstacle": 0}
+
+    def add_plot(self, *args, **kwargs):
+        plot_id = super().add_plot(*args, **kwargs)
+        if len(self._objects) >= self.flush_rows:
+            self.flush()
+        return plot_id
+
+    def add_obstacle(self, *args, **kwargs):
+        obstacle_id = super().add_obstacle(*args, **kwargs)
+        if len(self._objects) >= self.flush_rows:
+            self.flush()
+        return obstacle_id
+
+    def add_plots(self, *args, **kwargs):
+        plot_ids = super().add_plots(*args, **kwargs)
+        if len(self._objects) >= self.flush_rows:
+            self.flush()
+        return plot_ids
+
+    def add_obstacles(self, *args, **kwargs):
+        obstacle_ids = super().add_obstacles(*args, **kwargs)
+        if len(self._objects) >= self.flush_rows:
+            self.flush()
+        return obstacle_ids
+
+    def flush(self):
+        if len(self._objects):
+            self._spool.seek(0, 2)
+            self._objects.dump(self._spool)
+            self._chunks.append(len(self._objects))
+            self._spooled_counts["layer"] += len(self._objects)
+            self._spooled_counts["plot"] += self._objects.kind.count(PLOT)
+            self._spooled_counts["obstacle"] += self._objects.kind.count(OBSTACLE)
+            self._objects = ObjectStore()
+
+        for bunch_id, bunch in self._bunches.items():
+            if not bunch["layers"]:
+                continue
+            if bunch_id not in self._bunch_spools:
+                self._bunch_spools[bunch_id] = tempfile.TemporaryFile()
+            spool = self._bunch_spools[bunch_id]
+            spool.seek(0, 2)
+            array("q", bunch["layers"]).tofile(spool)
+            bunch["layers"].clear()
+
+    def count_objects(self):
+        counts = super().count_objects()
+        for kind, count in self._spooled_counts.items():
+            counts[kind] += count
+        return counts
+
+    def get_data(self):
+        document = super().get_data()
+        for bunch in document["tables"]["Bunch"]:
+            if not isinstance(bunch["layers"], list):
+                bunch["layers"] = list(bunch["layers"])
+        return document
+
+    def close(self):
+        self._spool.close()
+        for spool in self._bunch_spools.values():
+            spool.close()
+
+    def _document(self):
+        document = super()._document()
+        tables = document["tables"]
+        tables["Bunch"] = (self._bunch_record(bunch) for bunch in tables["Bunch"])
+        for name, records in (
+            ("Layer", ObjectStore.layers),
+            ("Obstacle", ObjectStore.obstacles),
+            ("Plot", ObjectStore.plots),
+        ):
+            tables[name] = itertools.chain(self._spooled(records), tables[name])
+
+        return document
+
+    # records from the object stores moved out so far, loading one at a time
+    def _spooled(self, records):
+        offset = 0
+        for rows in self._chunks:
+            self._spool.seek(offset)
+            store = ObjectStore.load(self._spool, rows)
+            offset = self._spool.tell()
+            yield from records(store)
+
+    def _bunch_record(self, bunch):
+        spool = self._bunch_spools.get(bunch["id"])
+        if spool is None:
+            return bunch
+
+        record = Streamed(bunch)
+        record["layers"] = itertools.chain(self._spooled_ids(spool), bunch["layers"])
+        return record
+
+    def _spooled_ids(self, spool, chunk: int = 65536):
+        spool.seek(0)
+        while True:
+            ids = array("q")
+            try:
+                ids.fromfile(spool, chunk)
+            except EOFError:
+                # fromfile keeps the items it did read before running out
+                yield from ids
+                return
+            yield from ids
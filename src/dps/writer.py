@@ -0,0 +1,95 @@
+# streams a DPS document to a file without building it as one string
+#
+# Text outside ASCII is written as it is rather than escaped, as orjson
+# writes it, so the file has to be opened as UTF-8.
+
+import json
+from collections.abc import Iterator
+from typing import Optional, TextIO
+
+# the document, its "tables" dict and each table are written piece by piece;
+# anything deeper (a single record) is small enough to go through json.dumps
+STREAM_DEPTH = 3
+
+
+# the separators json.dumps uses for indented output, or the tightest ones
+# when there is no indent
+def separators(indent: Optional[int]):
+    if indent is None:
+        return (",", ":")
+    return (",", ": ")
+
+
+def dumps(data, indent: Optional[int] = 2) -> str:
+    return json.dumps(
+        data, ensure_ascii=False, indent=indent, separators=separators(indent)
+    )
+
+
+# write data to fp; the result is byte-identical to dumps(data, indent)
+def write_json(data, fp: TextIO, indent: Optional[int] = 2):
+    _write(fp, data, 0, indent, separators(indent))
+
+
+# a record with iterators among its values; it is written piece by piece even
+# below STREAM_DEPTH so the iterators never have to be turned into lists
+class Streamed(dict):
+    pass
+
+
+def _write(fp: TextIO, value, depth: int, indent: Optional[int], seps):
+    if depth >= STREAM_DEPTH and type(value) is dict:
+        # plain records, by far the most common case
+        _write_dumps(fp, value, depth, indent, seps)
+    elif isinstance(value, Streamed) or (
+        depth < STREAM_DEPTH and isinstance(value, dict)
+    ):
+        _write_items(
+            fp,
+            ((_key(k) + seps[1], v) for k, v in value.items()),
+            "{",
+            "}",
+            depth,
+            indent,
+            seps,
+        )
+    elif isinstance(value, Iterator) or (
+        depth < STREAM_DEPTH and isinstance(value, (list, tuple))
+    ):
+        # iterators are written as lists, at any depth, so records and long
+        # lists inside records can be generated on demand
+        _write_items(fp, (("", v) for v in value), "[", "]", depth, indent, seps)
+    else:
+        _write_dumps(fp, value, depth, indent, seps)
+
+
+def _key(key: str) -> str:
+    return json.dumps(key, ensure_ascii=False)
+
+
+def _write_dumps(fp: TextIO, value, depth: int, indent: Optional[int], seps):
+    text = json.dumps(value, ensure_ascii=False, indent=indent, separators=seps)
+    if indent is not None and depth:
+        text = text.replace("\n", "\n" + " " * (indent * depth))
+    fp.write(text)
+
+
+def _write_items(fp: TextIO, items, open_, close, depth, indent, seps):
+    if indent is None:
+        newline = inner = ""
+    else:
+        newline = "\n" + " " * (indent * depth)
+        inner = newline + " " * indent
+
+    fp.write(open_)
+    first = True
+    for prefix, value in items:
+        if not first:
+            fp.write(seps[0])
+        first = False
+        fp.write(inner + prefix)
+        _write(fp, value, depth + 1, indent, seps)
+
+    if not first:
+        fp.write(newline)
+    fp.write(close)
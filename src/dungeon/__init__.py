@@ -1,8 +1,8 @@
 # defines a dungeon map
 
 from enum import Enum
-import csv
-from pathlib import Path
+
+from src.dungeon.features import FEATURES, classify_rows
 
 
 class Tile(Enum):
@@ -24,28 +24,60 @@ class OutOfBoundsError(Exception):
     pass
 
 
+# Tile members indexed by their code, and which codes count as empty space
+TILES = tuple(sorted(Tile, key=lambda tile: tile.value))
+EMPTY_TILES = (Tile.EMPTY, Tile.SECRET_DOOR_HORIZONTAL, Tile.SECRET_DOOR_VERTICAL)
+EMPTY_CODES = bytes(tile in EMPTY_TILES for tile in TILES) + bytes(256 - len(TILES))
+EMPTY_DIGITS = bytes(b"01"[empty] for empty in EMPTY_CODES)
+
+
 class Dungeon:
-    def __init__(self, width, height):
+    # The map is held as one tile code per byte, row by row, with a ring of
+    # EMPTY cells around the edge so neighbours of any cell on the map can be
+    # read without bounds checks.
+    def __init__(self, width, height, verbose=True):
         self.width = width
         self.height = height
-        self._map = [[Tile.EMPTY for y in range(height)] for x in range(width)]
-        print(f"created dungeon map width {self.width} height {self.height}")
+        self._stride = width + 2
+        self._grid = bytearray(self._stride * (height + 2))
+        if verbose:
+            print(f"created dungeon map width {self.width} height {self.height}")
 
     def _check_bounds(self, x: int, y: int):
-        if x < 0 or x > self.width or y < 0 or y > self.height:
-            raise Exception(f"x:{x} y:{y} out of bounds")
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            raise OutOfBoundsError(f"x:{x} y:{y} out of bounds")
+
+    # position of a map cell in the padded grid
+    def _index(self, x: int, y: int) -> int:
+        return (y + 1) * self._stride + x + 1
+
+    # position of a map cell in the padded grid, or None if it is off the map
+    def _cell(self, x: int, y: int):
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return None
+        return (y + 1) * self._stride + x + 1
 
     def set_tile(self, x: int, y: int, tile: Tile):
         self._check_bounds(x, y)
-        try:
-            self._map[x][y] = tile
-        except Exception as e:
-            print(f"exception x:{x} y:{y}")
-            raise e
+        self._grid[self._index(x, y)] = tile.value
+
+    # set a whole row from a bytes-like object of tile codes
+    def set_row(self, y: int, codes):
+        if len(codes) != self.width:
+            raise OutOfBoundsError(f"row of {len(codes)} tiles for width {self.width}")
+        self._check_bounds(0, y)
+        start = self._index(0, y)
+        self._grid[start : start + self.width] = codes
+
+    # the tile codes of a whole row
+    def get_row(self, y: int) -> bytes:
+        self._check_bounds(0, y)
+        start = self._index(0, y)
+        return bytes(self._grid[start : start + self.width])
 
     def get_tile(self, x: int, y: int) -> Tile:
         self._check_bounds(x, y)
-        return self._map[x][y]
+        return TILES[self._grid[self._index(x, y)]]
 
     def print(self):
         for y in range(self.height):
@@ -78,245 +110,304 @@ class Dungeon:
             print()
 
     def tile(self, x: int, y: int, *args) -> bool:
-        if x < 0 or y < 0 or x > self.width - 1 or y > self.height - 1:
-            raise OutOfBoundsError()
-
-        tiles = set(args)
-
-        tile = self._map[x][y]
-        return tile in tiles
+        self._check_bounds(x, y)
+        return TILES[self._grid[self._index(x, y)]] in args
 
     def tile_empty(self, x: int, y: int) -> bool:
-        return self.tile(
-            x, y, Tile.EMPTY, Tile.SECRET_DOOR_HORIZONTAL, Tile.SECRET_DOOR_VERTICAL
-        )
+        self._check_bounds(x, y)
+        return bool(EMPTY_CODES[self._grid[self._index(x, y)]])
+
+    # The predicates below read neighbours straight out of the padded grid.
+    # The ring around the map is EMPTY, and every predicate that looks past
+    # the edge needs a non-empty cell there, so they come out False exactly
+    # as if the edge had been range checked.
 
     def is_corner_out_down_left(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and not self.tile_empty(x - 1, y)
-                and not self.tile_empty(x, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and not e[g[i - 1]] and not e[g[i + w]])
 
     def is_corner_out_up_left(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and not self.tile_empty(x, y - 1)
-                and not self.tile_empty(x - 1, y)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and not e[g[i - w]] and not e[g[i - 1]])
 
     def is_corner_out_down_right(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and not self.tile_empty(x + 1, y)
-                and not self.tile_empty(x, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and not e[g[i + 1]] and not e[g[i + w]])
 
     def is_corner_out_up_right(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and not self.tile_empty(x + 1, y)
-                and not self.tile_empty(x, y - 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and not e[g[i + 1]] and not e[g[i - w]])
 
     def is_wall_vertical_up_left(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x, y - 1)
-                and not self.tile_empty(x - 1, y)
-                and not self.tile_empty(x - 1, y - 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i - w]] and not e[g[i - 1]] and not e[g[i - w - 1]])
 
     def is_wall_vertical_down_left(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x, y + 1)
-                and not self.tile_empty(x - 1, y)
-                and not self.tile_empty(x - 1, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i + w]] and not e[g[i - 1]] and not e[g[i + w - 1]])
 
     def is_wall_vertical_up_right(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x, y - 1)
-                and not self.tile_empty(x + 1, y)
-                and not self.tile_empty(x + 1, y - 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i - w]] and not e[g[i + 1]] and not e[g[i - w + 1]])
 
     def is_wall_vertical_down_right(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x, y + 1)
-                and not self.tile_empty(x + 1, y)
-                and not self.tile_empty(x + 1, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i + w]] and not e[g[i + 1]] and not e[g[i + w + 1]])
 
     def is_wall_horizontal_up_left(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x - 1, y)
-                and not self.tile_empty(x, y - 1)
-                and not self.tile_empty(x - 1, y - 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i - 1]] and not e[g[i - w]] and not e[g[i - w - 1]])
 
     def is_wall_horizontal_up_right(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x + 1, y)
-                and not self.tile_empty(x, y - 1)
-                and not self.tile_empty(x + 1, y - 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i + 1]] and not e[g[i - w]] and not e[g[i - w + 1]])
 
     def is_wall_horizontal_down_left(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x - 1, y)
-                and not self.tile_empty(x, y + 1)
-                and not self.tile_empty(x - 1, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i - 1]] and not e[g[i + w]] and not e[g[i + w - 1]])
 
     def is_wall_horizontal_down_right(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x + 1, y)
-                and not self.tile_empty(x, y + 1)
-                and not self.tile_empty(x + 1, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i + 1]] and not e[g[i + w]] and not e[g[i + w + 1]])
 
     def is_corner_in_up_left(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x - 1, y)
-                and self.tile_empty(x, y - 1)
-                and not self.tile_empty(x - 1, y - 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i - 1]] and e[g[i - w]] and not e[g[i - w - 1]])
 
     def is_corner_in_up_right(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x + 1, y)
-                and self.tile_empty(x, y - 1)
-                and not self.tile_empty(x + 1, y - 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i + 1]] and e[g[i - w]] and not e[g[i - w + 1]])
 
     def is_corner_in_down_left(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x - 1, y)
-                and self.tile_empty(x, y + 1)
-                and not self.tile_empty(x - 1, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i - 1]] and e[g[i + w]] and not e[g[i + w - 1]])
 
     def is_corner_in_down_right(self, x: int, y: int) -> bool:
-        try:
-            return (
-                self.tile_empty(x, y)
-                and self.tile_empty(x + 1, y)
-                and self.tile_empty(x, y + 1)
-                and not self.tile_empty(x + 1, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return bool(e[g[i]] and e[g[i + 1]] and e[g[i + w]] and not e[g[i + w + 1]])
 
     def is_in_room(self, x: int, y: int) -> bool:
-        try:
-            return (
-                not self.tile_empty(x, y)
-                and not self.tile_empty(x - 1, y)
-                and not self.tile_empty(x, y - 1)
-                and not self.tile_empty(x + 1, y)
-                and not self.tile_empty(x, y + 1)
-            )
-        except OutOfBoundsError:
+        i = self._cell(x, y)
+        if i is None:
             return False
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return not (e[g[i]] or e[g[i - 1]] or e[g[i - w]] or e[g[i + 1]] or e[g[i + w]])
+
+    # 8 bit mask of which neighbours of a cell are empty, in the order of
+    # src.dungeon.rules.NEIGHBOURS; cells off the map count as empty
+    def neighbourhood(self, x: int, y: int) -> int:
+        i = self._index(x, y)
+        g, e, w = self._grid, EMPTY_CODES, self._stride
+        return (
+            e[g[i - w - 1]]
+            | e[g[i - w]] << 1
+            | e[g[i - w + 1]] << 2
+            | e[g[i - 1]] << 3
+            | e[g[i + 1]] << 4
+            | e[g[i + w - 1]] << 5
+            | e[g[i + w]] << 6
+            | e[g[i + w + 1]] << 7
+        )
+
+    # one int per padded row with bit x + 1 set when cell x is empty
+    def empty_rows(self):
+        stride = self._stride
+        rows = []
+        for start in range(0, len(self._grid), stride):
+            digits = self._grid[start : start + stride].translate(EMPTY_DIGITS)
+            rows.append(int(digits[::-1], 2))
+        return rows
+
+    # Evaluate features, by default those of src.dungeon.features, for the
+    # whole map at once. Returns the (x, y) cells matching each feature, keyed
+    # by its name, in row-major order.
+    def classify(self, features=FEATURES):
+        return classify_rows(self.empty_rows(), self.width, features)
 
     def debug(self, x, y):
-        print(f"x pos {x} len {len(self._map)} y pos {y} len {len(self._map[0])}")
-
-
-def load_donjon_tsv(filename: str) -> Dungeon:
-    tmpArray = []
-    if Path(filename).is_file():
-        with open(filename) as fd:
-            rd = csv.reader(fd, delimiter="\t")
-            for row in rd:
-                tmpArray.append(row)
-
-    if len(tmpArray) == 0:
-        raise Exception("donjon TSV file contains no data or was unable to be parsed")
-
-    dungeon = Dungeon(len(tmpArray[0]), len(tmpArray))
-
-    mapping = {
-        "F": Tile.ROOM,
-        "DR": Tile.DOOR_VERTICAL,
-        "DL": Tile.DOOR_VERTICAL,
-        "DT": Tile.DOOR_HORIZONTAL,
-        "DB": Tile.DOOR_HORIZONTAL,
-        "DSL": Tile.SECRET_DOOR_VERTICAL,
-        "DSR": Tile.SECRET_DOOR_VERTICAL,
-        "DST": Tile.SECRET_DOOR_HORIZONTAL,
-        "DSB": Tile.SECRET_DOOR_HORIZONTAL,
-        "DPT": Tile.PORTCULLIS_HORIZONTAL,
-        "DPB": Tile.PORTCULLIS_HORIZONTAL,
-        "DPL": Tile.PORTCULLIS_VERTICAL,
-        "DPR": Tile.PORTCULLIS_VERTICAL,
-        "SUU": Tile.STAIRS_UP_BOTTOM,
-        "SU": Tile.STAIRS_UP_TOP,
-        "SDD": Tile.STAIRS_DOWN_BOTTOM,
-        "SD": Tile.STAIRS_DOWN_TOP,
-    }
-
-    for y, row in enumerate(tmpArray):
-        for x, item in enumerate(row):
-            if item in mapping:
-                dungeon.set_tile(x, y, mapping[item])
-            else:
-                dungeon.set_tile(x, y, Tile.EMPTY)
+        print(f"x pos {x} width {self.width} y pos {y} height {self.height}")
+
+
+# donjon TSV cell codes; anything else is empty space
+DONJON_TILES = {
+    "F": Tile.ROOM,
+    "DR": Tile.DOOR_VERTICAL,
+    "DL": Tile.DOOR_VERTICAL,
+    "DT": Tile.DOOR_HORIZONTAL,
+    "DB": Tile.DOOR_HORIZONTAL,
+    "DSL": Tile.SECRET_DOOR_VERTICAL,
+    "DSR": Tile.SECRET_DOOR_VERTICAL,
+    "DST": Tile.SECRET_DOOR_HORIZONTAL,
+    "DSB": Tile.SECRET_DOOR_HORIZONTAL,
+    "DPT": Tile.PORTCULLIS_HORIZONTAL,
+    "DPB": Tile.PORTCULLIS_HORIZONTAL,
+    "DPL": Tile.PORTCULLIS_VERTICAL,
+    "DPR": Tile.PORTCULLIS_VERTICAL,
+    "SUU": Tile.STAIRS_UP_BOTTOM,
+    "SU": Tile.STAIRS_UP_TOP,
+    "SDD": Tile.STAIRS_DOWN_BOTTOM,
+    "SD": Tile.STAIRS_DOWN_TOP,
+}
+
+
+class DonjonParseError(Exception):
+    pass
+
+
+class _DonjonCodes(dict):
+    def __missing__(self, key):
+        return Tile.EMPTY.value
+
+
+# raw cell bytes to tile codes, so a row converts in a single map() call
+DONJON_CODES = _DonjonCodes(
+    {name.encode(): tile.value for name, tile in DONJON_TILES.items()}
+)
+DONJON_CODES[b""] = Tile.EMPTY.value
+
+
+# tile codes for one line of a donjon TSV file, or None if it does not have
+# exactly width cells
+def parse_donjon_row(line: bytes, width: int):
+    cells = line.rstrip(b"\r").split(b"\t")
+    if len(cells) != width:
+        return None
+    return bytes(map(DONJON_CODES.__getitem__, cells))
+
+
+def load_donjon_tsv(filename: str, verbose=True) -> Dungeon:
+    with open(filename, "rb") as fd:
+        return parse_donjon_tsv(fd.read(), filename, verbose)
+
+
+# parse the contents of a donjon TSV file; name is what error messages call it
+def parse_donjon_tsv(data: bytes, name: str = "<tsv>", verbose=True) -> Dungeon:
+    lines = data.split(b"\n")
+
+    # the last line ends with a newline, and editors may add blank lines
+    while lines and lines[-1].rstrip(b"\r") == b"":
+        lines.pop()
+    if len(lines) == 0:
+        raise DonjonParseError(
+            "donjon TSV file contains no data or was unable to be parsed"
+        )
+
+    width = lines[0].count(b"\t") + 1
+    dungeon = Dungeon(width, len(lines), verbose)
+
+    malformed = []
+    for y, line in enumerate(lines):
+        codes = parse_donjon_row(line, width)
+        if codes is None:
+            malformed.append(y + 1)
+        else:
+            dungeon.set_row(y, codes)
+
+    if malformed:
+        shown = ", ".join(str(line) for line in malformed[:10])
+        if len(malformed) > 10:
+            shown += f" and {len(malformed) - 10} more"
+        raise DonjonParseError(
+            f"{name}: rows do not have {width} cells on lines {shown}"
+        )
 
     return dungeon
+
+
+# Read a donjon TSV file one row at a time without loading the whole map.
+# Yields (y, window) for each row y, where window is a Dungeon three rows high
+# holding map rows y - 1, y and y + 1; rows past the edge of the map are
+# empty. The same window object is refilled for every row.
+def stream_donjon_tsv(filename: str, verbose=True):
+    with open(filename, "rb") as fd:
+        lines = _numbered_lines(fd)
+        number, line = next(lines, (0, b""))
+        if number == 0:
+            raise DonjonParseError(
+                "donjon TSV file contains no data or was unable to be parsed"
+            )
+
+        width = line.count(b"\t") + 1
+        window = Dungeon(width, 3, verbose)
+        empty = bytes(width)
+        rows = [empty, parse_donjon_row(line, width)]
+        for number, line in lines:
+            codes = parse_donjon_row(line, width)
+            if codes is None:
+                raise DonjonParseError(
+                    f"{filename}: row does not have {width} cells on line {number}"
+                )
+            rows.append(codes)
+            yield number - 2, _fill_window(window, rows)
+            rows.pop(0)
+
+        rows.append(empty)
+        yield number - 1, _fill_window(window, rows)
+
+
+# the lines of a file numbered from 1 without their newlines, leaving out the
+# blank lines at its end as parse_donjon_tsv does
+def _numbered_lines(fd):
+    blank = []
+    for number, line in enumerate(fd, 1):
+        line = line.rstrip(b"\n")
+        if line.rstrip(b"\r") == b"":
+            blank.append((number, line))
+            continue
+        yield from blank
+        blank.clear()
+        yield number, line
+
+
+def _fill_window(window: Dungeon, rows) -> Dungeon:
+    for y, codes in enumerate(rows):
+        window.set_row(y, codes)
+    return window
@@ -0,0 +1,39 @@
+# classifies every cell of a dungeon at once using one bitmask per row
+#
+# Each row of the map is an int with bit x+1 set when cell x is empty, padded
+# with an empty cell at either end, so shifting a row left or right lines each
+# cell up with its neighbour. A feature is then a handful of ands over the row,
+# the row above (u) and the row below (d).
+#
+# The wall and corner pieces are found through the compiled rule table of
+# src.dungeon.rules; only the features the rules do not cover live here.
+
+# in_room is Dungeon.is_in_room: the cell and its four orthogonal neighbours
+# are solid
+FEATURES = {
+    "in_room": lambda c, u, d: ~c & ~(c << 1) & ~u & ~(c >> 1) & ~d,
+}
+
+
+# x positions of the set bits in a row mask, lowest first
+def _bits(mask: int):
+    digits = bin(mask)[:1:-1]
+    found = digits.find("1")
+    while found != -1:
+        yield found - 1
+        found = digits.find("1", found + 1)
+
+
+# rows holds height + 2 padded row masks, the first and last being the empty
+# rows above and below the map. Returns a list of (x, y) per feature name.
+def classify_rows(rows, width: int, features=FEATURES):
+    inner = ((1 << width) - 1) << 1
+    found = {name: [] for name in features}
+    for y in range(len(rows) - 2):
+        u, c, d = rows[y], rows[y + 1], rows[y + 2]
+        for name, feature in features.items():
+            mask = feature(c, u, d) & inner
+            if mask:
+                found[name].extend((x, y) for x in _bits(mask))
+
+    return found
@@ -0,0 +1,36 @@
+# merges runs of identical cells into rectangles
+
+
+# Greedy meshing over rows of cell keys, where None is a cell that is not
+# drawn. Each rectangle is grown as wide as it can go from its top left cell
+# and then as tall as its full width allows. Returns (x, y, width, height, key)
+# tuples in row-major order of their top left corners.
+def merge_rectangles(rows):
+    height = len(rows)
+    done = [[False] * len(row) for row in rows]
+    rectangles = []
+    for y, row in enumerate(rows):
+        for x, key in enumerate(row):
+            if key is None or done[y][x]:
+                continue
+
+            end = x + 1
+            while end < len(row) and row[end] == key and not done[y][end]:
+                end += 1
+
+            bottom = y + 1
+            while bottom < height and _run_matches(rows, done, bottom, x, end, key):
+                bottom += 1
+
+            for covered in done[y:bottom]:
+                covered[x:end] = [True] * (end - x)
+            rectangles.append((x, y, end - x, bottom - y, key))
+
+    return rectangles
+
+
+def _run_matches(rows, done, y, start, end, key) -> bool:
+    row = rows[y]
+    if len(row) < end:
+        return False
+    return all(row[x] == key and not done[y][x] for x in range(start, end))
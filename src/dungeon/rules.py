@@ -0,0 +1,214 @@
+# declarative autotile rules: what to draw for each tile and neighbourhood
+#
+# A neighbourhood rule is a 3x3 pattern over the cell and its 8 neighbours:
+# "." must be empty, "#" must not be empty and "?" is anything. The cell in
+# the middle is always empty; walls are drawn in the empty space around rooms.
+# A RuleSet compiles its rules into a 256 entry table indexed by the
+# neighbourhood bitmask, so each cell costs one mask and one lookup.
+
+from typing import NamedTuple
+
+from src.dungeon import Tile
+
+# offsets of the neighbours in bitmask order; bit n is set when the
+# neighbour at NEIGHBOURS[n] is empty
+NEIGHBOURS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+
+class Emit(NamedTuple):
+    # "plot" or "obstacle"
+    kind: str
+    # offset from the top left corner of the cell, in DPS units
+    x: float
+    y: float
+    # texture set name and bunch name to draw it with
+    texture: str
+    bunch: str
+    angle: int = 0
+    # size of a plot
+    width: float = 0
+    height: float = 0
+
+
+def plot(x, y, width, height, texture, bunch="Floor") -> Emit:
+    return Emit("plot", x, y, texture, bunch, width=width, height=height)
+
+
+def obstacle(x, y, texture, angle=0, bunch="Wall") -> Emit:
+    return Emit("obstacle", x, y, texture, bunch, angle=angle)
+
+
+class Rule:
+    def __init__(self, name: str, pattern, emits):
+        if len(pattern) != 3 or any(len(row) != 3 for row in pattern):
+            raise ValueError(f"rule {name}: pattern must be 3 rows of 3 cells")
+        if pattern[1][1] != ".":
+            raise ValueError(f"rule {name}: the middle cell must be empty")
+
+        self.name = name
+        self.emits = tuple(emits)
+        # bits that must be set (empty) and bits that must be clear
+        self.empty = 0
+        self.solid = 0
+        for bit, (dx, dy) in enumerate(NEIGHBOURS):
+            cell = pattern[dy + 1][dx + 1]
+            if cell == ".":
+                self.empty |= 1 << bit
+            elif cell == "#":
+                self.solid |= 1 << bit
+            elif cell != "?":
+                raise ValueError(f"rule {name}: unknown pattern cell {cell!r}")
+
+    def matches(self, mask: int) -> bool:
+        return mask & self.empty == self.empty and not mask & self.solid
+
+
+class RuleSet:
+    # tiles maps a Tile to what is drawn on it whatever its neighbours are
+    def __init__(self, tiles, rules):
+        self.tiles = dict(tiles)
+        self.rules = list(rules)
+        self._table = None
+
+    # bunch names in the order they are first used
+    @property
+    def bunches(self):
+        emits = [emit for emits in self.tiles.values() for emit in emits]
+        emits += [emit for rule in self.rules for emit in rule.emits]
+        return list(dict.fromkeys(emit.bunch for emit in emits))
+
+    # the emits of every matching rule, in rule order, for each bitmask
+    def compile(self):
+        if self._table is None:
+            self._table = tuple(
+                tuple(
+                    emit
+                    for rule in self.rules
+                    if rule.matches(mask)
+                    for emit in rule.emits
+                )
+                for mask in range(256)
+            )
+        return self._table
+
+    def lookup(self, mask: int):
+        return self.compile()[mask]
+
+
+# the FA dungeon tileset: 2x2 floor plots with 1x2 wall pieces around them
+FA_DUNGEON_RULES = RuleSet(
+    tiles={
+        Tile.ROOM: [plot(0, 0, 2, 2, "floor")],
+        Tile.DOOR_HORIZONTAL: [
+            plot(0, 0, 2, 2, "floor"),
+            obstacle(0.5, 0.5, "door"),
+        ],
+        Tile.DOOR_VERTICAL: [
+            plot(0, 0, 2, 2, "floor"),
+            obstacle(1.5, 0.5, "door", angle=90),
+        ],
+        Tile.SECRET_DOOR_HORIZONTAL: [plot(0, 0, 2, 2, "floor_other")],
+        Tile.SECRET_DOOR_VERTICAL: [plot(0, 0, 2, 2, "floor_other")],
+        Tile.STAIRS_DOWN_TOP: [plot(0, 0, 2, 2, "floor_other")],
+        Tile.STAIRS_DOWN_BOTTOM: [plot(0, 0, 2, 2, "floor_other")],
+        Tile.STAIRS_UP_TOP: [plot(0, 0, 2, 2, "floor_other")],
+        Tile.STAIRS_UP_BOTTOM: [plot(0, 0, 2, 2, "floor_other")],
+    },
+    rules=[
+        # outside corners fill the floor under the corner piece
+        Rule(
+            "corner_out_down_left",
+            ["???", "#.?", "?#?"],
+            [
+                plot(0, 1.5, 0.5, 0.5, "floor"),
+                obstacle(0.5, 1.5, "corner_out", angle=90),
+            ],
+        ),
+        Rule(
+            "corner_out_up_left",
+            ["?#?", "#.?", "???"],
+            [
+                plot(0, 0, 0.5, 0.5, "floor"),
+                obstacle(0.5, 0.5, "corner_out", angle=180),
+            ],
+        ),
+        Rule(
+            "corner_out_down_right",
+            ["???", "?.#", "?#?"],
+            [
+                plot(1.5, 1.5, 0.5, 0.5, "floor"),
+                obstacle(1.5, 1.5, "corner_out", angle=0),
+            ],
+        ),
+        Rule(
+            "corner_out_up_right",
+            ["?#?", "?.#", "???"],
+            [
+                plot(1.5, 0, 0.5, 0.5, "floor"),
+                obstacle(1.5, 0.5, "corner_out", angle=270),
+            ],
+        ),
+        # walls
+        Rule(
+            "wall_vertical_down_left",
+            ["???", "#.?", "#.?"],
+            [obstacle(-0.5, 1.5, "wall", angle=270)],
+        ),
+        Rule(
+            "wall_vertical_up_left",
+            ["#.?", "#.?", "???"],
+            [obstacle(-0.5, 0.5, "wall", angle=270)],
+        ),
+        Rule(
+            "wall_vertical_down_right",
+            ["???", "?.#", "?.#"],
+            [obstacle(2.5, 1.5, "wall", angle=90)],
+        ),
+        Rule(
+            "wall_vertical_up_right",
+            ["?.#", "?.#", "???"],
+            [obstacle(2.5, 0.5, "wall", angle=90)],
+        ),
+        Rule(
+            "wall_horizontal_up_left",
+            ["##?", "..?", "???"],
+            [obstacle(0.5, -0.5, "wall", angle=0)],
+        ),
+        Rule(
+            "wall_horizontal_up_right",
+            ["?##", "?..", "???"],
+            [obstacle(1.5, -0.5, "wall", angle=0)],
+        ),
+        Rule(
+            "wall_horizontal_down_left",
+            ["???", "..?", "##?"],
+            [obstacle(0.5, 2.5, "wall", angle=180)],
+        ),
+        Rule(
+            "wall_horizontal_down_right",
+            ["???", "?..", "?##"],
+            [obstacle(1.5, 2.5, "wall", angle=180)],
+        ),
+        # inside corners
+        Rule(
+            "corner_in_up_left",
+            ["#.?", "..?", "???"],
+            [obstacle(-0.5, -0.5, "corner_in", angle=0)],
+        ),
+        Rule(
+            "corner_in_up_right",
+            ["?.#", "?..", "???"],
+            [obstacle(2.5, -0.5, "corner_in", angle=90)],
+        ),
+        Rule(
+            "corner_in_down_left",
+            ["???", "..?", "#.?"],
+            [obstacle(-0.5, 2.5, "corner_in", angle=270)],
+        ),
+        Rule(
+            "corner_in_down_right",
+            ["???", "?..", "?.#"],
+            [obstacle(2.5, 2.5, "corner_in", angle=180)],
+        ),
+    ],
+)
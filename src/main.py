@@ -1,246 +1,157 @@
-import click
-from src.dps import Map, Location, Size, TextureSet
-from src.dungeon import Tile, load_donjon_tsv
-import random
-
-
-@click.command()
-@click.argument("input_filename")
-@click.argument("output_filename")
-def main(input_filename: str, output_filename: str):
-    random.seed()
-
-    click.echo(f"attempting to convert {input_filename} to {output_filename}")
-    dungeon = load_donjon_tsv(input_filename)
-
-    click.echo(f"map is {dungeon.height} high and {dungeon.width} wide")
-
-    # initialize textures
-    map = Map()
-    textures = TextureSet(map, "fa_dungeon_textures.json")
-    floor_bunch_id = map.add_bunch("Floor")
-    wall_bunch_id = map.add_bunch("Wall")
-    floor_id = textures.get("floor")
-
-    for y in range(dungeon.height):
-        for x in range(dungeon.width):
-            tile = dungeon.get_tile(x, y)
-            if tile is Tile.ROOM:
-                map.add_plot(
-                    Location(x * 2, y * 2), Size(2, 2), floor_id, floor_bunch_id,
-                )
-            if (
-                tile is Tile.SECRET_DOOR_HORIZONTAL
-                or tile is Tile.SECRET_DOOR_VERTICAL
-                or tile is Tile.STAIRS_DOWN_BOTTOM
-                or tile is Tile.STAIRS_DOWN_TOP
-                or tile is Tile.STAIRS_UP_BOTTOM
-                or tile is Tile.STAIRS_UP_TOP
-            ):
-                map.add_plot(
-                    Location(x * 2, y * 2),
-                    Size(2, 2),
-                    textures.get("floor_other"),
-                    floor_bunch_id,
-                )
-            if tile is Tile.DOOR_HORIZONTAL:
-                map.add_plot(
-                    Location(x * 2, y * 2), Size(2, 2), floor_id, floor_bunch_id,
-                )
-                map.add_obstacle(
-                    Location(x * 2 + 0.5, y * 2 + 0.5),
-                    textures.get("door"),
-                    wall_bunch_id,
-                )
-            if tile is Tile.DOOR_VERTICAL:
-                map.add_plot(
-                    Location(x * 2, y * 2), Size(2, 2), floor_id, floor_bunch_id,
-                )
-                map.add_obstacle(
-                    Location(x * 2 + 1.5, y * 2 + 0.5),
-                    textures.get("door"),
-                    wall_bunch_id,
-                    angle=90,
-                )
-
-            # corners
-            if dungeon.is_corner_out_down_left(x, y):
-                map.add_plot(
-                    Location(x * 2, y * 2 + 1.5),
-                    Size(0.5, 0.5),
-                    floor_id,
-                    floor_bunch_id,
-                )
-                map.add_obstacle(
-                    Location(x * 2 + 0.5, y * 2 + 1.5),
-                    textures.get("corner_out"),
-                    wall_bunch_id,
-                    angle=90,
-                )
-            if dungeon.is_corner_out_up_left(x, y):
-                map.add_plot(
-                    Location(x * 2, y * 2), Size(0.5, 0.5), floor_id, floor_bunch_id,
-                )
-                map.add_obstacle(
-                    Location(x * 2 + 0.5, y * 2 + 0.5),
-                    textures.get("corner_out"),
-                    wall_bunch_id,
-                    angle=180,
-                )
-
-            if dungeon.is_corner_out_down_right(x, y):
-                map.add_plot(
-                    Location(x * 2 + 1.5, y * 2 + 1.5),
-                    Size(0.5, 0.5),
-                    floor_id,
-                    floor_bunch_id,
-                )
-                map.add_obstacle(
-                    Location(x * 2 + 1.5, y * 2 + 1.5),
-                    textures.get("corner_out"),
-                    wall_bunch_id,
-                    angle=0,
-                )
-
-            if dungeon.is_corner_out_up_right(x, y):
-                map.add_plot(
-                    Location(x * 2 + 1.5, y * 2),
-                    Size(0.5, 0.5),
-                    floor_id,
-                    floor_bunch_id,
-                )
-                map.add_obstacle(
-                    Location(x * 2 + 1.5, y * 2 + 0.5),
-                    textures.get("corner_out"),
-                    wall_bunch_id,
-                    angle=270,
-                )
-
-            # walls
-            if dungeon.is_wall_vertical_down_left(x, y):
-                map.add_obstacle(
-                    Location(x * 2 - 0.5, y * 2 + 1.5),
-                    textures.get("wall"),
-                    wall_bunch_id,
-                    angle=270,
-                )
-
-            if dungeon.is_wall_vertical_up_left(x, y):
-                map.add_obstacle(
-                    Location(x * 2 - 0.5, y * 2 + 0.5),
-                    textures.get("wall"),
-                    wall_bunch_id,
-                    angle=270,
-                )
-
-            if dungeon.is_wall_vertical_down_right(x, y):
-                map.add_obstacle(
-                    Location(x * 2 + 2.5, y * 2 + 1.5),
-                    textures.get("wall"),
-                    wall_bunch_id,
-                    angle=90,
-                )
-
-            if dungeon.is_wall_vertical_up_right(x, y):
-                map.add_obstacle(
-                    Location(x * 2 + 2.5, y * 2 + 0.5),
-                    textures.get("wall"),
-                    wall_bunch_id,
-                    angle=90,
-                )
-
-            if dungeon.is_wall_horizontal_up_left(x, y):
-                map.add_obstacle(
-                    Location(x * 2 + 0.5, y * 2 - 0.5),
-                    textures.get("wall"),
-                    wall_bunch_id,
-                    angle=0,
-                )
-
-            if dungeon.is_wall_horizontal_up_right(x, y):
-                map.add_obstacle(
-                    Location(x * 2 + 1.5, y * 2 - 0.5),
-                    textures.get("wall"),
-                    wall_bunch_id,
-                    angle=0,
-                )
-
-            if dungeon.is_wall_horizontal_down_left(x, y):
-                map.add_obstacle(
-                    Location(x * 2 + 0.5, y * 2 + 2.5),
-                    textures.get("wall"),
-                    wall_bunch_id,
-                    angle=180,
-                )
-
-            if dungeon.is_wall_horizontal_down_right(x, y):
-                map.add_obstacle(
-                    Location(x * 2 + 1.5, y * 2 + 2.5),
-                    textures.get("wall"),
-                    wall_bunch_id,
-                    angle=180,
-                )
-
-            if dungeon.is_corner_in_up_left(x, y):
-                map.add_obstacle(
-                    Location(x * 2 - 0.5, y * 2 - 0.5),
-                    textures.get("corner_in"),
-                    wall_bunch_id,
-                    angle=0,
-                )
-
-            if dungeon.is_corner_in_up_right(x, y):
-                map.add_obstacle(
-                    Location(x * 2 + 2.5, y * 2 - 0.5),
-                    textures.get("corner_in"),
-                    wall_bunch_id,
-                    angle=90,
-                )
-
-            if dungeon.is_corner_in_down_left(x, y):
-                map.add_obstacle(
-                    Location(x * 2 - 0.5, y * 2 + 2.5),
-                    textures.get("corner_in"),
-                    wall_bunch_id,
-                    angle=270,
-                )
-
-            if dungeon.is_corner_in_down_right(x, y):
-                map.add_obstacle(
-                    Location(x * 2 + 2.5, y * 2 + 2.5),
-                    textures.get("corner_in"),
-                    wall_bunch_id,
-                    angle=180,
-                )
-
-            if dungeon.is_in_room(x, y):
-                if random.randint(1, 10) == 5:
-                    what = random.randint(1, 10)
-
-                    if what < 4:
-                        map.add_obstacle(
-                            Location(x * 2, y * 2),
-                            textures.get("blood"),
-                            floor_bunch_id,
-                            angle=random.randrange(0, 359),
-                        )
-                    elif what < 6:
-                        map.add_obstacle(
-                            Location(x * 2, y * 2),
-                            textures.get("skeleton"),
-                            floor_bunch_id,
-                            angle=random.randrange(0, 359),
-                        )
-                    else:
-                        map.add_obstacle(
-                            Location(x * 2, y * 2),
-                            textures.get("broken_weapon"),
-                            floor_bunch_id,
-                            angle=random.randrange(0, 359),
-                        )
-
-    with open(output_filename, "w") as f:
-        f.write(map.get_json())
+# the dps-converter command
+#
+# A plain "dps-converter INPUT OUTPUT" is converted here without importing
+# click, which takes longer than converting a small map. Anything else is
+# handed to the full command line in src.cli.
+
+import sys
+
+from src.converter import Converter
+from src.converter.profile import Profile
+from src.converter.scatter import parse_scatter
+from src.dungeon import DonjonParseError, load_donjon_tsv
+
+# The defaults of the src.cli options a plain conversion depends on. The
+# options take their defaults from here, so both ways of converting agree.
+DEFAULTS = {
+    "compact": False,
+    "encoder": "json",
+    "merge_floors": False,
+    "seed": None,
+    "decorations": None,
+    "stream": False,
+    "parallel": False,
+    "workers": None,
+}
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    # seeded conversions are cached, which only src.cli sets up
+    plain = DEFAULTS["seed"] is None
+    if not plain or len(args) != 2 or any(arg.startswith("-") for arg in args):
+        from src.cli import main as command
+
+        command(args)
+        return
+
+    input_filename, output_filename = args
+    settings = converter_settings(
+        DEFAULTS["merge_floors"], DEFAULTS["seed"], DEFAULTS["decorations"]
+    )
+    options = dict(
+        indent=None if DEFAULTS["compact"] else 2,
+        encoder=DEFAULTS["encoder"],
+        stream=DEFAULTS["stream"],
+        parallel=DEFAULTS["parallel"],
+        workers=DEFAULTS["workers"],
+    )
+    converter = Converter(**settings)
+    try:
+        convert(converter, input_filename, output_filename, Profile(), **options)
+    except (DonjonParseError, OSError) as e:
+        # as click reports a ClickException
+        print(f"Error: {e}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+# the Converter keyword arguments for the given options, raising ValueError
+# for decorations that cannot be parsed
+def converter_settings(merge_floors: bool, seed: int, decorations: str):
+    settings = dict(merge_floors=merge_floors, seed=seed)
+    if decorations is not None:
+        settings.update(scatter=parse_scatter(decorations))
+    return settings
+
+
+def convert(
+    converter: Converter,
+    input_filename: str,
+    output_filename: str,
+    profile: Profile,
+    indent,
+    encoder: str,
+    stream: bool,
+    parallel: bool,
+    workers: int,
+    cell_index=False,
+    previous=None,
+    previous_output=None,
+    cache=None,
+):
+    print(f"attempting to convert {input_filename} to {output_filename}")
+    if previous:
+        from src.converter import incremental
+
+        print(f"updating {previous_output} for the changes since {previous}")
+        with profile.stage("update"):
+            try:
+                map, encoded = incremental.update_file(
+                    converter,
+                    previous,
+                    previous_output,
+                    input_filename,
+                    output_filename,
+                    indent,
+                    encoder,
+                )
+            except incremental.CellIndexError as e:
+                import click
+
+                raise click.ClickException(str(e))
+        report_encoded(encoded)
+        profile.count(map)
+        return
+
+    if cell_index:
+        from src.converter import incremental
+
+        with profile.stage("convert"):
+            map, encoded = incremental.convert_file(
+                converter, input_filename, output_filename, indent, encoder
+            )
+        report_encoded(encoded)
+        profile.count(map)
+        return
+
+    if cache is not None:
+        with profile.stage("cache"):
+            options = dict(indent=indent, stream=stream, encoder=encoder)
+            key = cache.key(input_filename, converter, options)
+            hit = cache.get(key, output_filename)
+        if hit:
+            print("unchanged since an earlier conversion, copied from the cache")
+            return
+
+    if stream:
+        with profile.stage("stream"):
+            map, encoded = converter.convert_file(
+                input_filename, output_filename, indent, stream=True, encoder=encoder
+            )
+    else:
+        with profile.stage("load"):
+            dungeon = load_donjon_tsv(input_filename)
+
+        print(f"map is {dungeon.height} high and {dungeon.width} wide")
+
+        with profile.stage("convert"):
+            map = converter.convert(dungeon, parallel, workers)
+
+        with profile.stage("write"):
+            encoded = map.save(output_filename, encoder, indent)
+
+    report_encoded(encoded)
+    if cache is not None:
+        with profile.stage("cache"):
+            cache.put(key, output_filename)
+    profile.count(map)
+
+
+def report_encoded(encoded):
+    print(
+        f"wrote {encoded.bytes} bytes with {encoded.encoder} "
+        f"in {encoded.seconds:.3f}s"
+    )
 
 
 if __name__ == "__main__":
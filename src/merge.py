@@ -0,0 +1,47 @@
+import click
+from src.dps.encoders import ENCODERS
+from src.dps.merge import merge_files
+
+
+@click.command()
+@click.argument("output_filename")
+@click.argument("input_filenames", nargs=-1, required=True)
+@click.option(
+    "--gap",
+    type=float,
+    default=4,
+    show_default=True,
+    help="DPS units between one level and the next.",
+)
+@click.option(
+    "--vertical",
+    is_flag=True,
+    help="Lay the levels out top to bottom instead of left to right.",
+)
+@click.option("--compact", is_flag=True, help="Write JSON without indentation.")
+@click.option(
+    "--encoder", type=click.Choice(ENCODERS), default="json", show_default=True
+)
+def main(
+    output_filename: str,
+    input_filenames,
+    gap: float,
+    vertical: bool,
+    compact: bool,
+    encoder: str,
+):
+    click.echo(f"merging {len(input_filenames)} maps into {output_filename}")
+    try:
+        merged = merge_files(input_filenames, gap, vertical)
+    except Exception as e:
+        raise click.ClickException(str(e))
+
+    encoded = merged.save(output_filename, encoder, None if compact else 2)
+    click.echo(
+        f"wrote {encoded.bytes} bytes with {encoded.encoder} "
+        f"in {encoded.seconds:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# a long running converter that answers requests as lines of JSON
+#
+# Each request is one line holding a JSON object such as
+#
+#     {"id": 1, "tsv": "<donjon TSV>", "options": {"merge_floors": true}}
+#
+# where options may hold merge_floors, seed and decorations as the command
+# line tool takes them. Each response is one line, either
+# {"id": 1, "dps": <the DPS document>} or {"id": 1, "error": "<message>"}.
+# Responses are written as conversions finish, which need not be the order
+# the requests came in, so clients match them up by id.
+#
+# Conversions run on a pool of worker processes that parse the template,
+# the texture catalog and the rules once when they start, so no request pays
+# for loading them. Requests wait for a worker in a queue of at most
+# queue_size; while it is full no more requests are read, so a client sending
+# faster than the pool converts is held back instead of filling memory.
+
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from src.converter import TEXTURES_FILENAME, Converter
+from src.converter.scatter import parse_scatter
+from src.dps import get_template, load_catalog
+from src.dungeon import parse_donjon_tsv
+from src.dungeon.rules import FA_DUNGEON_RULES
+
+QUEUE_SIZE = 32
+
+# the longest request line read from a socket
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+OPTIONS = ("merge_floors", "seed", "decorations")
+
+
+# the initializer of each worker, which loads the DPS template, the default
+# texture catalog and the compiled rule table into the caches that the
+# converters of every request share
+def _load_template_textures_and_rules():
+    get_template()
+    load_catalog(TEXTURES_FILENAME)
+    FA_DUNGEON_RULES.compile()
+
+
+def _settings(options):
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+        raise ValueError(f"unknown options {', '.join(sorted(unknown))}")
+
+    settings = dict(options)
+    decorations = settings.pop("decorations", None)
+    if decorations is not None:
+        settings.update(scatter=parse_scatter(decorations))
+    return settings
+
+
+# convert the text of a donjon TSV file, returning the DPS document as one
+# line of JSON
+def convert(tsv: str, options) -> str:
+    converter = Converter(**_settings(options))
+    dungeon = parse_donjon_tsv(tsv.encode(), "request", verbose=False)
+    return converter.convert(dungeon).get_json(None)
+
+
+def _response(request_id, document: str = None, error: str = None) -> bytes:
+    if error is not None:
+        return (json.dumps({"id": request_id, "error": error}) + "\n").encode()
+    return f'{{"id":{json.dumps(request_id)},"dps":{document}}}\n'.encode()
+
+
+# the request on a line, or a ValueError saying what is wrong with it
+def _parse_request(line: bytes):
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("a request must be a JSON object")
+    if not isinstance(request.get("tsv"), str):
+        raise ValueError('a request needs the donjon TSV text as "tsv"')
+    if not isinstance(request.get("options", {}), dict):
+        raise ValueError('"options" must be a JSON object')
+    return request
+
+
+class Service:
+    # pool is the executor conversions run on and workers the number of
+    # conversions it runs at once
+    def __init__(self, pool, workers: int, queue_size: int = QUEUE_SIZE):
+        self._pool = pool
+        self._queue = asyncio.Queue(queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+    # Answer the requests read by read_line, a coroutine function returning
+    # the next line or b"" at the end, by passing response lines to respond,
+    # a coroutine function. Returns once every request has been answered.
+    async def serve(self, read_line, respond):
+        loop = asyncio.get_running_loop()
+        pending = set()
+        while True:
+            line = await read_line()
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            try:
+                request = _parse_request(line)
+            except ValueError as e:
+                request_id = _request_id(line)
+                await respond(_response(request_id, error=f"bad request: {e}"))
+                continue
+
+            done = loop.create_future()
+            pending.add(done)
+            done.add_done_callback(pending.discard)
+            # waits while the queue is full, which stops reading requests
+            await self._queue.put((request, respond, done))
+
+        if pending:
+            await asyncio.wait(pending)
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request, respond, done = await self._queue.get()
+            request_id = request.get("id")
+            try:
+                document = await loop.run_in_executor(
+                    self._pool, convert, request["tsv"], request.get("options", {})
+                )
+                line = _response(request_id, document)
+            except Exception as e:
+                line = _response(request_id, error=f"{type(e).__name__}: {e}")
+
+            try:
+                await respond(line)
+            except ConnectionError:
+                # the client went away before its answer was ready
+                pass
+            finally:
+                done.set_result(None)
+                self._queue.task_done()
+
+
+def _request_id(line: bytes):
+    try:
+        return json.loads(line).get("id")
+    except (ValueError, AttributeError):
+        return None
+
+
+# answer requests on stdin until it is closed
+async def serve_stdio(service: Service):
+    loop = asyncio.get_running_loop()
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+
+    async def read_line():
+        return await loop.run_in_executor(None, stdin.readline)
+
+    async def respond(line: bytes):
+        stdout.write(line)
+        stdout.flush()
+
+    await service.serve(read_line, respond)
+
+
+# answer requests on every connection to a unix socket at path, or to port on
+# the loopback interface, until cancelled
+async def serve_socket(service: Service, path: str = None, port: int = None):
+    async def handle(reader, writer):
+        lock = asyncio.Lock()
+
+        async def read_line():
+            try:
+                return await reader.readline()
+            except ValueError:
+                await respond(_response(None, error="request too long"))
+                return b""
+
+        async def respond(line: bytes):
+            async with lock:
+                writer.write(line)
+                await writer.drain()
+
+        try:
+            await service.serve(read_line, respond)
+        finally:
+            writer.close()
+
+    if path is not None:
+        server = await asyncio.start_unix_server(handle, path, limit=MAX_REQUEST_BYTES)
+    else:
+        server = await asyncio.start_server(
+            handle, "127.0.0.1", port, limit=MAX_REQUEST_BYTES
+        )
+    async with server:
+        await server.serve_forever()
+
+
+# Run the service on stdin and stdout, or on a unix socket at socket_path or
+# a loopback port, with workers conversions at once (one per CPU by default).
+def run(workers=None, queue_size=QUEUE_SIZE, socket_path=None, port=None):
+    asyncio.run(_run(workers or os.cpu_count() or 1, queue_size, socket_path, port))
+
+
+async def _run(workers: int, queue_size: int, socket_path, port):
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(
+        workers, initializer=_load_template_textures_and_rules
+    ) as pool:
+        # the pool forks a worker per submission until it has all of them, so
+        # submit one small call per worker to fork them all before any thread
+        # (such as the one reading stdin) is started
+        await asyncio.gather(
+            *(loop.run_in_executor(pool, os.getpid) for _ in range(workers))
+        )
+
+        service = Service(pool, workers, queue_size)
+        try:
+            if socket_path is None and port is None:
+                await serve_stdio(service)
+            else:
+                await serve_socket(service, socket_path, port)
+        finally:
+            service.close()
@@ -0,0 +1,40 @@
+import click
+
+from src.service import QUEUE_SIZE, run
+
+
+@click.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Listen on a unix socket at this path instead of stdin and stdout.",
+)
+@click.option(
+    "--port",
+    type=int,
+    default=None,
+    help="Listen on this port on 127.0.0.1 instead of stdin and stdout.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Worker processes converting at once. Defaults to one per CPU.",
+)
+@click.option(
+    "--queue-size",
+    type=click.IntRange(min=1),
+    default=QUEUE_SIZE,
+    show_default=True,
+    help="Requests that may wait for a worker before no more are read.",
+)
+def main(socket_path, port, workers, queue_size):
+    if socket_path is not None and port is not None:
+        raise click.UsageError("--socket and --port cannot be used together")
+    run(workers, queue_size, socket_path, port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import pytest
+
+from src.bench.generate import generate
+from src.dungeon import parse_donjon_tsv
+
+
+# builds a Dungeon from a generated donjon map, quietly
+@pytest.fixture
+def make_dungeon():
+    def make(width=30, height=20, density=0.5, seed=0):
+        data = generate(width, height, density, seed).encode()
+        return parse_donjon_tsv(data, verbose=False)
+
+    return make
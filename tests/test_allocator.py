@@ -0,0 +1,38 @@
+# allocating IDs in bulk hands out the same IDs as one at a time
+
+import pytest
+
+from src.dps.allocator import IdAllocator
+
+
+@pytest.mark.parametrize("used", [(), (1, 2, 3), (2, 5, 9), (0, 4)])
+@pytest.mark.parametrize("count", [0, 1, 3, 10])
+def test_allocate_many_matches_allocate(used, count):
+    one_by_one = IdAllocator(used)
+    at_once = IdAllocator(used)
+    assert list(at_once.allocate_many(count)) == [
+        one_by_one.allocate() for _ in range(count)
+    ]
+    assert at_once.peek() == one_by_one.peek()
+
+
+def test_gaps_are_filled_first():
+    ids = IdAllocator([2, 5])
+    assert [ids.allocate() for _ in range(5)] == [1, 3, 4, 6, 7]
+
+
+def test_released_ids_are_reused_lowest_first():
+    ids = IdAllocator()
+    assert ids.allocate_many(6) == range(1, 7)
+    ids.release(5)
+    ids.release(2)
+    assert ids.peek() == 2
+    assert list(ids.allocate_many(3)) == [2, 5, 7]
+    assert ids.allocate() == 8
+
+
+@pytest.mark.parametrize("never", [0, -1, 4])
+def test_release_of_unallocated_id(never):
+    ids = IdAllocator([1, 2, 3])
+    with pytest.raises(Exception, match="never allocated"):
+        ids.release(never)
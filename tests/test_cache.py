@@ -0,0 +1,68 @@
+# converted maps are cached by everything that decides them, only when
+# seeded, and the entries used longest ago are evicted first
+
+import os
+
+from src.bench.generate import generate
+from src.converter import Converter
+from src.converter import cache
+
+
+def tsv(tmp_path, seed=0, name="map.tsv"):
+    path = tmp_path / name
+    path.write_text(generate(20, 12, 0.5, seed))
+    return str(path)
+
+
+def test_key_covers_settings_options_and_input(tmp_path):
+    outputs = cache.OutputCache(str(tmp_path / "cache"))
+    filename = tsv(tmp_path)
+    converter = Converter(seed=1, verbose=False)
+    key = outputs.key(filename, converter, {"indent": 2})
+
+    assert outputs.key(filename, Converter(seed=1), {"indent": 2}) == key
+    assert outputs.key(filename, Converter(seed=2), {"indent": 2}) != key
+    merged = Converter(seed=1, merge_floors=True)
+    assert outputs.key(filename, merged, {"indent": 2}) != key
+    assert outputs.key(filename, Converter(seed=1, scatter=())) != key
+    assert outputs.key(filename, converter, {"indent": None}) != key
+    assert outputs.key(tsv(tmp_path, seed=1, name="other.tsv"), converter) != key
+
+
+def test_seeded_conversions_are_cached(tmp_path):
+    outputs = cache.OutputCache(str(tmp_path / "cache"))
+    filename = tsv(tmp_path)
+    converter = Converter(seed=1, verbose=False)
+    first, second = str(tmp_path / "first.dps"), str(tmp_path / "second.dps")
+
+    assert not cache.convert_file(converter, outputs, filename, first)
+    assert cache.convert_file(converter, outputs, filename, second)
+    with open(first, "rb") as a, open(second, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_unseeded_conversions_are_not_cached(tmp_path):
+    outputs = cache.OutputCache(str(tmp_path / "cache"))
+    filename = tsv(tmp_path)
+    converter = Converter(verbose=False)
+    output = str(tmp_path / "map.dps")
+
+    assert not cache.cacheable(converter)
+    assert not cache.convert_file(converter, outputs, filename, output)
+    assert not cache.convert_file(converter, outputs, filename, output)
+    assert os.listdir(outputs.directory) == []
+
+
+def test_evicts_least_recently_used(tmp_path):
+    outputs = cache.OutputCache(str(tmp_path / "cache"))
+    source = tmp_path / "source.dps"
+    source.write_bytes(b"x" * 1000)
+    for seconds, key in enumerate(("a", "b", "c"), 1):
+        outputs.put(key, str(source))
+        os.utime(outputs._path(key), ns=(0, seconds * 10**9))
+
+    # a hit makes a, the oldest entry, the most recently used
+    assert outputs.get("a", str(tmp_path / "out.dps"))
+    outputs.max_bytes = 2500
+    outputs.evict()
+    assert sorted(os.listdir(outputs.directory)) == ["a.dps", "c.dps"]
@@ -0,0 +1,27 @@
+# every encoder saves the same UTF-8 JSON
+
+import gzip
+import json
+
+import pytest
+
+from src.dps import Map
+from src.dps.encoders import ENCODERS, save_document
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_encoders_write_the_same_bytes(tmp_path, indent):
+    map = Map()
+    map.add_texture("textures/café/ščí 龍.png")
+
+    saved = set()
+    for encoder in ENCODERS:
+        filename = tmp_path / f"map.{encoder}"
+        save_document(map, str(filename), encoder, indent)
+        data = filename.read_bytes()
+        if encoder == "gzip":
+            data = gzip.decompress(data)
+        assert json.loads(data.decode("utf-8")) == map.get_data()
+        saved.add(data)
+
+    assert saved == {map.get_json(indent).encode("utf-8")}
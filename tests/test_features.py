@@ -0,0 +1,22 @@
+# the row bitmask features agree with the Dungeon.is_* predicates they stand in
+# for
+
+import pytest
+
+from src.dungeon.features import FEATURES
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_classify_matches_predicates(make_dungeon, seed):
+    dungeon = make_dungeon(seed=seed)
+    found = dungeon.classify()
+    assert set(found) == set(FEATURES)
+    for name, cells in found.items():
+        predicate = getattr(dungeon, f"is_{name}")
+        expected = [
+            (x, y)
+            for y in range(dungeon.height)
+            for x in range(dungeon.width)
+            if predicate(x, y)
+        ]
+        assert cells == expected, name
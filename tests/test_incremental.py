@@ -0,0 +1,92 @@
+# updating a converted map for an edited donjon map gives what converting the
+# edited map from scratch gives, leaving objects away from the edit alone
+
+import json
+from collections import Counter
+
+from src.bench.generate import generate
+from src.converter import Converter
+from src.converter import incremental
+from src.dps import load_catalog
+
+
+# the rows of one generated map with rows top to bottom of another
+def edited(top, bottom):
+    rows = generate(30, 20, 0.5, 1).split("\n")
+    edit = generate(30, 20, 0.5, 2).split("\n")
+    rows[top:bottom] = edit[top:bottom]
+    return "\n".join(rows)
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def tables(filename):
+    with open(filename) as f:
+        return json.load(f)["tables"]
+
+
+# every object by texture name, bunch and position, ignoring IDs and which
+# variant of a texture it got
+def drawn(filename, converter):
+    names = {
+        path: name
+        for name, paths in load_catalog(converter.textures_filename).items()
+        for path in paths
+    }
+    found = tables(filename)
+    helpers = {h["id"]: names[h["path"]] for h in found["TextureItemHelper"]}
+    bunches = {b["id"]: b["name"] for b in found["Bunch"]}
+    parents = {layer["data"]: bunches[layer["parent"]] for layer in found["Layer"]}
+    objects = Counter()
+    for plot in found["Plot"]:
+        points = tuple((p["x"], p["y"]) for p in plot["points"])
+        objects["plot", helpers[plot["helper"]], parents[plot["id"]], points] += 1
+    for obstacle in found["Obstacle"]:
+        begin = obstacle["begin"]["x"], obstacle["begin"]["y"]
+        objects[
+            "obstacle",
+            helpers[obstacle["helper"]],
+            parents[obstacle["id"]],
+            begin,
+            obstacle["angle"],
+        ] += 1
+    return objects
+
+
+def update(tmp_path, converter, top, bottom):
+    previous = write(tmp_path / "previous.tsv", edited(0, 0))
+    current = write(tmp_path / "current.tsv", edited(top, bottom))
+    output = str(tmp_path / "map.dps")
+    incremental.convert_file(converter, previous, output)
+    before = tables(output)
+    incremental.update_file(converter, previous, output, current, output)
+    return current, output, before
+
+
+def test_update_matches_fresh_conversion(tmp_path):
+    converter = Converter(scatter=(), seed=4, verbose=False)
+    current, output, _ = update(tmp_path, converter, 6, 12)
+    fresh = str(tmp_path / "fresh.dps")
+    converter.convert_file(current, fresh)
+    assert drawn(output, converter) == drawn(fresh, converter)
+
+
+def test_update_keeps_objects_away_from_the_edit(tmp_path):
+    converter = Converter(seed=4, verbose=False)
+    _, output, before = update(tmp_path, converter, 12, 14)
+    after = tables(output)
+    for name in ("Plot", "Obstacle"):
+        kept = {record["id"]: record for record in after[name]}
+        for record in before[name]:
+            # rows 11 to 14 are redrawn, and cells are 2 units high
+            if _top(record) < 20:
+                assert kept.get(record["id"]) == record
+
+
+def _top(record):
+    if record["points"]:
+        return min(point["y"] for point in record["points"])
+    return record["begin"]["y"]
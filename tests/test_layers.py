@@ -0,0 +1,71 @@
+# moving layers between bunches and walking the bunch tree, for layers in the
+# object store and for layers of a loaded map
+
+import pytest
+
+from src.dps import Location, Map, Size
+
+
+def parents(map):
+    layers = map.get_data()["tables"]["Layer"]
+    return {layer["id"]: layer["parent"] for layer in layers}
+
+
+def build():
+    map = Map()
+    floor, wall = map.add_bunch("Floor"), map.add_bunch("Wall")
+    texture = map.add_texture("floor.png")
+    for x in range(4):
+        map.add_plot(Location(x, 0), Size(2, 2), texture, floor)
+    return map, floor, wall
+
+
+def saved(tmp_path, map):
+    filename = str(tmp_path / "map.dps")
+    map.save(filename)
+    return Map.load(filename)
+
+
+@pytest.mark.parametrize("loaded", [False, True])
+def test_move_layers(tmp_path, loaded):
+    map, floor, wall = build()
+    if loaded:
+        map = saved(tmp_path, map)
+    layers = list(map.get_bunch_by_id(floor)["layers"])
+
+    # duplicates are moved once, in the order first given
+    map.move_layers([layers[2], layers[0], layers[2]], wall)
+    assert map.get_bunch_by_id(floor)["layers"] == [layers[1], layers[3]]
+    assert map.get_bunch_by_id(wall)["layers"] == [layers[2], layers[0]]
+    assert map.get_layer_by_id(layers[0])["parent"] == wall
+    assert parents(map) == {
+        layers[0]: wall,
+        layers[1]: floor,
+        layers[2]: wall,
+        layers[3]: floor,
+    }
+
+
+def test_move_unknown_layer():
+    map, floor, wall = build()
+    with pytest.raises(Exception, match="could not find layer id 999"):
+        map.move_layers([999], wall)
+    with pytest.raises(Exception, match="could not find bunch id 999"):
+        map.move_layers(map.get_bunch_by_id(floor)["layers"], 999)
+
+
+def test_get_subtree_is_depth_first():
+    level, _, _ = build()
+    map = Map()
+    bunch = map.add_map(level, "level")
+
+    # the level's Floor and Wall bunches now sit under its bunch
+    tree = map.get_data()["tables"]
+    copied = {b["name"]: b for b in tree["Bunch"] if b.get("parent") == bunch}
+    expected = []
+    for name in ("Floor", "Wall"):
+        expected.append(copied[name]["id"])
+        expected.extend(copied[name]["layers"])
+    assert map.get_subtree(bunch) == expected
+    assert map.get_subtree(copied["Wall"]["id"]) == []
+    assert len(map.get_subtree(1)) == len(expected) + 1
@@ -0,0 +1,77 @@
+# merging maps remaps every ID into one pool and shares texture helpers
+
+from collections import Counter
+
+import pytest
+
+from src.converter import Converter
+from src.dps.merge import Level, bounds, merge, merge_files
+
+
+def converted(make_dungeon, seed):
+    return Converter(seed=seed, verbose=False).convert(make_dungeon(seed=seed))
+
+
+def objects(tables):
+    return [record for name in ("Plot", "Obstacle", "Wall") for record in tables[name]]
+
+
+@pytest.fixture
+def levels(make_dungeon):
+    return [converted(make_dungeon, seed) for seed in (1, 2)]
+
+
+def test_merge_remaps_ids(levels):
+    merged = merge([Level(levels[0], "one"), Level(levels[1], "two", 100, 50)])
+    tables = merged.get_data()["tables"]
+
+    bunch_ids = [record["id"] for record in tables["Bunch"] + tables["Layer"]]
+    assert len(bunch_ids) == len(set(bunch_ids))
+    object_ids = [record["id"] for record in objects(tables)]
+    assert len(object_ids) == len(set(object_ids))
+    assert Counter(layer.get("data") for layer in tables["Layer"]) == Counter(
+        object_ids
+    )
+
+    # every layer hangs under a bunch, and each object under its level
+    bunches = {bunch["id"]: bunch for bunch in tables["Bunch"]}
+    assert all(layer["parent"] in bunches for layer in tables["Layer"])
+    for level, name in zip(levels, ("one", "two")):
+        bunch = merged.get_bunch_by_name(name)
+        subtree = set(merged.get_subtree(bunch["id"]))
+        held = [layer for layer in tables["Layer"] if layer["id"] in subtree]
+        assert len(held) == len(objects(level.get_data()["tables"]))
+
+
+def test_merge_moves_levels(levels):
+    merged = merge([Level(levels[1], "two", 100, 50)])
+    left, top, right, bottom = bounds(levels[1])
+    assert bounds(merged) == (left + 100, top + 50, right + 100, bottom + 50)
+
+
+def test_merge_shares_texture_helpers(levels):
+    merged = merge([Level(levels[0], "one"), Level(levels[1], "two")])
+    tables = merged.get_data()["tables"]
+    paths = [helper["path"] for helper in tables["TextureItemHelper"]]
+    assert len(paths) == len(set(paths))
+
+    helpers = {helper["id"]: helper["path"] for helper in tables["TextureItemHelper"]}
+    used = set()
+    for level in levels:
+        level_tables = level.get_data()["tables"]
+        level_helpers = {h["id"]: h["path"] for h in level_tables["TextureItemHelper"]}
+        used.update(level_helpers[record["helper"]] for record in objects(level_tables))
+    assert {helpers[record["helper"]] for record in objects(tables)} == used
+
+
+def test_merge_files_side_by_side(tmp_path, levels):
+    filenames = [str(tmp_path / f"level{i}.dps") for i in range(len(levels))]
+    for level, filename in zip(levels, filenames):
+        level.save(filename)
+
+    merged = merge_files(filenames, gap=4)
+    widths = [bounds(level)[2] - bounds(level)[0] for level in levels]
+    assert bounds(merged)[0] == 0
+    assert bounds(merged)[2] == widths[0] + 4 + widths[1]
+    names = [bunch["name"] for bunch in merged.get_data()["tables"]["Bunch"]]
+    assert {"level0", "level1"} <= set(names)
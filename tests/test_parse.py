@@ -0,0 +1,53 @@
+# donjon TSV files parse the same whole or streamed, and report the lines of
+# malformed rows
+
+import pytest
+
+from src.dungeon import DonjonParseError, parse_donjon_tsv, stream_donjon_tsv
+
+MAP = b"F\tF\t\n\tDT\tF\nF\t\tF\n"
+
+
+def rows(dungeon):
+    return [bytes(dungeon.get_row(y)) for y in range(dungeon.height)]
+
+
+def write(tmp_path, data):
+    path = tmp_path / "map.tsv"
+    path.write_bytes(data)
+    return str(path)
+
+
+def streamed_rows(filename):
+    return [bytes(window.get_row(1)) for _, window in stream_donjon_tsv(filename)]
+
+
+@pytest.mark.parametrize("ending", [b"", b"\n", b"\r\n\r\n", b"\n\n\n"])
+def test_trailing_blank_lines(tmp_path, ending):
+    data = MAP.rstrip(b"\n") + ending
+    dungeon = parse_donjon_tsv(data, verbose=False)
+    assert (dungeon.width, dungeon.height) == (3, 3)
+    assert rows(dungeon) == rows(parse_donjon_tsv(MAP, verbose=False))
+    assert streamed_rows(write(tmp_path, data)) == rows(dungeon)
+
+
+@pytest.mark.parametrize("data", [b"", b"\n\n", b"\r\n"])
+def test_empty_file(tmp_path, data):
+    with pytest.raises(DonjonParseError, match="no data"):
+        parse_donjon_tsv(data)
+    with pytest.raises(DonjonParseError, match="no data"):
+        list(stream_donjon_tsv(write(tmp_path, data)))
+
+
+def test_malformed_line_numbers(tmp_path):
+    data = MAP + b"F\n\nF\tF\tF\n"
+    with pytest.raises(DonjonParseError, match=r"map\.tsv: .* lines 4, 5$"):
+        parse_donjon_tsv(data, "map.tsv")
+    with pytest.raises(DonjonParseError, match=r"map\.tsv: .* line 4$"):
+        list(stream_donjon_tsv(write(tmp_path, data)))
+
+
+def test_many_malformed_lines_are_counted():
+    data = b"F\tF\n" + b"F\n" * 12
+    with pytest.raises(DonjonParseError, match=r"lines 2, 3, .*, 11 and 2 more$"):
+        parse_donjon_tsv(data)
@@ -0,0 +1,62 @@
+# the streaming reader reads back what json.dumps and the encoders wrote
+
+import io
+import json
+
+import pytest
+
+from src.converter import Converter
+from src.dps import Map
+from src.dps.encoders import ENCODERS
+from src.dps.reader import read_json
+
+DOCUMENT = {
+    "name": "café ☃",
+    "tables": {
+        "Empty": [],
+        "Plot": [
+            {"id": 1, "points": [{"x": 0, "y": 0.5}, {"x": -2, "y": 1e21}]},
+            {"id": 12345678, "nested": {"deeper": [[], {}, [1, [2, [3]]]]}},
+        ],
+        "Texture": [{"path": 'textures/"quoted"\\path', "id": 3}],
+    },
+    "flags": [True, False, None],
+}
+
+
+# chunks small enough to cut numbers, strings and keys in two
+@pytest.mark.parametrize("chunk", [1, 7, 64, 1024 * 1024])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_read_round_trip(make_dungeon, chunk, indent):
+    converted = Converter(seed=3).convert(make_dungeon(seed=2)).get_data()
+    for document in (DOCUMENT, converted):
+        text = json.dumps(document, ensure_ascii=False, indent=indent)
+        assert read_json(io.StringIO(text), chunk) == document
+
+
+@pytest.mark.parametrize(
+    "text", ["", "{", '{"a": 1,}', '{"a": 1} 2', '{"tables": {"Plot": [1 2]}}']
+)
+def test_read_rejects_bad_json(text):
+    with pytest.raises(ValueError):
+        read_json(io.StringIO(text), 4)
+
+
+@pytest.mark.parametrize("encoder", ENCODERS)
+def test_load_round_trip(make_dungeon, tmp_path, encoder):
+    map = Converter(seed=3).convert(make_dungeon(seed=2))
+    filename = str(tmp_path / "map.dps")
+    map.save(filename, encoder)
+    assert Map.load(filename).get_json() == map.get_json()
+
+
+def test_loaded_map_continues_ids(make_dungeon, tmp_path):
+    map = Converter(seed=3).convert(make_dungeon(seed=2))
+    filename = str(tmp_path / "map.dps")
+    map.save(filename)
+    loaded = Map.load(filename)
+
+    assert loaded.get_bunch_by_name("Floor") == map.get_bunch_by_name("Floor")
+    assert loaded.get_texture_ids() == map.get_texture_ids()
+    assert loaded.get_next_object_id() == map.get_next_object_id()
+    assert loaded.get_next_bunch_id() == map.get_next_bunch_id()
@@ -0,0 +1,28 @@
+# the compiled rule table agrees with the Dungeon.is_* predicates it replaced
+
+import pytest
+
+from src.dungeon.rules import FA_DUNGEON_RULES
+
+
+def cells(dungeon):
+    return [(x, y) for y in range(dungeon.height) for x in range(dungeon.width)]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_rules_match_predicates(make_dungeon, seed):
+    dungeon = make_dungeon(seed=seed)
+    for rule in FA_DUNGEON_RULES.rules:
+        predicate = getattr(dungeon, f"is_{rule.name}")
+        for x, y in cells(dungeon):
+            mask = dungeon.neighbourhood(x, y)
+            matched = dungeon.tile_empty(x, y) and rule.matches(mask)
+            assert matched == predicate(x, y), (rule.name, x, y)
+
+
+def test_table_holds_emits_of_matching_rules():
+    table = FA_DUNGEON_RULES.compile()
+    assert len(table) == 256
+    for mask, emits in enumerate(table):
+        rules = [rule for rule in FA_DUNGEON_RULES.rules if rule.matches(mask)]
+        assert emits == tuple(emit for rule in rules for emit in rule.emits)
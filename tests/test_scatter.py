@@ -0,0 +1,36 @@
+# decorations are placed from the seed and checked against the catalog
+
+import pytest
+
+from src.converter import Converter
+from src.converter.scatter import Decoration, parse_scatter
+
+
+def test_seeded_conversions_repeat(make_dungeon):
+    dungeon = make_dungeon(seed=1)
+    first = Converter(seed=7).convert(dungeon).get_json(None)
+    assert Converter(seed=7).convert(dungeon).get_json(None) == first
+    assert Converter(seed=8).convert(dungeon).get_json(None) != first
+
+
+def test_parse_scatter():
+    assert parse_scatter("blood=0.03, skeleton=0.5") == (
+        Decoration("blood", 0.03),
+        Decoration("skeleton", 0.5),
+    )
+    assert parse_scatter("none") == ()
+    with pytest.raises(ValueError):
+        parse_scatter("blood")
+
+
+@pytest.mark.parametrize(
+    "scatter",
+    [
+        [Decoration("nonexistent", 0.1)],
+        [Decoration("blood", -0.1)],
+        [Decoration("blood", 0.6), Decoration("skeleton", 0.6)],
+    ],
+)
+def test_bad_scatter(scatter):
+    with pytest.raises(ValueError):
+        Converter(scatter=scatter)
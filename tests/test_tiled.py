@@ -0,0 +1,52 @@
+# drawing a map in parallel bands gives the same document as drawing it serially
+
+import pytest
+
+from src.converter import Converter
+from src.dps import Location, Map, Size
+from src.dps.store import OBSTACLE, PLOT, ObjectStore
+
+
+@pytest.mark.parametrize("merge_floors", [False, True])
+def test_parallel_matches_serial(make_dungeon, merge_floors):
+    # tall enough to be cut into several bands
+    dungeon = make_dungeon(40, 70, seed=3)
+    converter = Converter(merge_floors=merge_floors, seed=5)
+    serial = converter.convert(dungeon).get_json(None)
+    parallel = converter.convert(dungeon, parallel=True, workers=2).get_json(None)
+    assert parallel == serial
+
+
+# a store added at once gets the IDs, helpers and layers the same objects
+# get added one by one, reused IDs included
+def test_add_objects_matches_adding_one_by_one():
+    objects = [
+        (PLOT, 0, 0, 2, 2, 0, 1),
+        (OBSTACLE, 2, 0, 0, 0, 90, 0),
+        (PLOT, 4, 2, 1, 2, 0, 0),
+        (OBSTACLE, 0, 4, 0, 0, 0, 1),
+    ]
+    maps = []
+    for at_once in (False, True):
+        map = Map()
+        bunches = [map.add_bunch("Floor"), map.add_bunch("Wall")]
+        helpers = [map.add_texture("a.png"), map.add_texture("b.png")]
+        freed = map.add_plot(Location(8, 8), Size(2, 2), helpers[0], bunches[0])
+        map.remove_objects([freed])
+
+        store = ObjectStore()
+        for kind, x, y, width, height, angle, texture in objects:
+            parent = bunches[kind]
+            if at_once:
+                store.append(kind, 0, 0, texture, parent, x, y, width, height, angle)
+            elif kind == PLOT:
+                map.add_plot(
+                    Location(x, y), Size(width, height), helpers[texture], parent
+                )
+            else:
+                map.add_obstacle(Location(x, y), helpers[texture], parent, angle=angle)
+        if at_once:
+            map.add_objects(store, helpers)
+        maps.append(map.get_json(None))
+
+    assert maps[0] == maps[1]
@@ -0,0 +1,53 @@
+# the streaming writer gives the same text as json.dumps
+
+import io
+import json
+
+import pytest
+
+from src.converter import Converter
+from src.dps.writer import Streamed, write_json
+
+DOCUMENT = {
+    "name": "level",
+    "tables": {
+        "Empty": [],
+        "Plot": [
+            {"id": 1, "points": [{"x": 0, "y": 0.5}, {"x": -2, "y": 1e21}]},
+            {"id": 2, "nested": {"deeper": [[], {}, [1, [2, [3]]]]}},
+        ],
+        "Texture": [{"path": 'textures/"quoted"\\path', "id": 3}],
+    },
+    "flags": [True, False, None],
+}
+
+
+@pytest.mark.parametrize("indent", [None, 2, 4])
+def test_write_matches_dumps(indent):
+    separators = (",", ":") if indent is None else (",", ": ")
+    expected = json.dumps(DOCUMENT, indent=indent, separators=separators)
+    written = io.StringIO()
+    write_json(DOCUMENT, written, indent)
+    assert written.getvalue() == expected
+
+
+def test_write_iterators_as_lists():
+    records = iter([{"id": 1}, {"id": 2}])
+    points = iter([{"x": 1}, {"x": 2}])
+    document = {"tables": {"Plot": records, "Layer": [Streamed(points=points)]}}
+    written = io.StringIO()
+    write_json(document, written, 2)
+    assert json.loads(written.getvalue()) == {
+        "tables": {
+            "Plot": [{"id": 1}, {"id": 2}],
+            "Layer": [{"points": [{"x": 1}, {"x": 2}]}],
+        }
+    }
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_map_write_matches_get_json(make_dungeon, indent):
+    map = Converter(seed=3).convert(make_dungeon(seed=2))
+    written = io.StringIO()
+    map.write(written, indent)
+    assert written.getvalue() == map.get_json(indent)